@@ -0,0 +1,102 @@
+"""
+Админские операции с привычками:
+
+    python -m Habit_TrackerBot.admin export habits.csv [--user ID] [--format json]
+    python -m Habit_TrackerBot.admin import habits.csv [--user ID] [--format json]
+    python -m Habit_TrackerBot.admin bench --rows 10000
+
+Без --user выгружаются все пользователи, а в файле появляется колонка user_id
+(при импорте она обязательна).
+"""
+import argparse
+import asyncio
+import csv
+import os
+import tempfile
+import time
+
+from Habit_TrackerBot import database, transfer
+
+BENCH_USER_ID = 9_100_000_000_000
+
+
+def _format(args) -> str:
+    if args.format:
+        return args.format
+    return "json" if args.path.lower().endswith((".json", ".jsonl")) else "csv"
+
+
+async def export_cmd(args):
+    exported = await transfer.export_habits(args.path, _format(args), args.user)
+    print(f"Экспортировано: {exported}")
+
+
+async def import_cmd(args):
+    started = time.monotonic()
+    imported = await transfer.import_habits(args.path, _format(args), args.user)
+    elapsed = time.monotonic() - started
+    print(f"Импортировано: {imported} за {elapsed:.2f} с ({imported / elapsed:.0f} строк/с)")
+
+
+async def bench_cmd(args):
+    # Сравнение COPY с построчными INSERT на синтетических данных
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(transfer.COLUMNS)
+        for i in range(args.rows):
+            writer.writerow((f"Привычка {i}", i % 50, i % 7, "2024-01-01"))
+
+    async def clear():
+        async with database.acquire() as conn:
+            await conn.execute("DELETE FROM habits WHERE user_id = $1", BENCH_USER_ID)
+
+    try:
+        await clear()
+        started = time.monotonic()
+        async with database.acquire() as conn:
+            async with conn.transaction():
+                for record in transfer.read_records(path, "csv", BENCH_USER_ID):
+                    await conn.execute(
+                        "INSERT INTO habits (user_id, name, count, streak, last_done) "
+                        "VALUES ($1, $2, $3, $4, $5)",
+                        *record
+                    )
+        row_by_row = time.monotonic() - started
+
+        await clear()
+        started = time.monotonic()
+        await transfer.import_habits(path, "csv", BENCH_USER_ID)
+        copy = time.monotonic() - started
+    finally:
+        await clear()
+        os.remove(path)
+
+    print(f"INSERT построчно: {row_by_row:.2f} с ({args.rows / row_by_row:.0f} строк/с)")
+    print(f"COPY:             {copy:.2f} с ({args.rows / copy:.0f} строк/с)")
+    print(f"Ускорение: x{row_by_row / copy:.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Импорт и экспорт привычек")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, handler in (("export", export_cmd), ("import", import_cmd)):
+        command = commands.add_parser(name)
+        command.add_argument("path")
+        command.add_argument("--user", type=int, help="Только этот пользователь")
+        command.add_argument("--format", choices=transfer.FORMATS)
+        command.set_defaults(handler=handler)
+
+    bench = commands.add_parser("bench")
+    bench.add_argument("--rows", type=int, default=10_000)
+    bench.set_defaults(handler=bench_cmd)
+
+    args = parser.parse_args()
+    await database.init_db()
+    await args.handler(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,257 @@
+"""
+Микробенчмарки:
+
+    python -m Habit_TrackerBot.bench stats --habits 20 --runs 500
+
+    python -m Habit_TrackerBot.bench logging --records 50000
+
+stats — задержка /stats и /week_stats: прежние последовательные запросы
+против текущих однозапросных get_stats / get_week_stats на локальном
+PostgreSQL. Новый /week_stats считает по истории habit_completions, а не
+по last_done, поэтому делает больше работы, чем прежние два запроса.
+Тестовый пользователь BENCH_USER_ID создаётся и удаляется.
+
+logging — насколько всплеск логов задерживает event loop: файловый и
+консольный handler прямо в потоке loop'а против LazyQueueHandler с
+QueueListener из logger.py. Пишет во временный каталог, база не нужна.
+"""
+import argparse
+import asyncio
+import logging
+import queue
+import random
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from Habit_TrackerBot import database
+from Habit_TrackerBot.logger import LazyQueueHandler
+
+BENCH_USER_ID = 9_300_000_000_000
+
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+
+def report(name: str, values):
+    print(
+        f"{name:<28}{percentile(values, 0.5) * 1000:>10.3f}"
+        f"{percentile(values, 0.99) * 1000:>10.3f}"
+    )
+
+
+# Запросы /stats и /week_stats до перевода на один запрос
+async def legacy_stats(user_id: int):
+    async with database.acquire() as conn:
+        total = await conn.fetchrow(
+            "SELECT COUNT(*) AS habits, COALESCE(SUM(count), 0) AS total_done "
+            "FROM habits WHERE user_id = $1",
+            user_id
+        )
+        best_streak = await conn.fetchrow(
+            "SELECT name, streak FROM habits "
+            "WHERE user_id = $1 ORDER BY streak DESC LIMIT 1",
+            user_id
+        )
+        top_habits = await conn.fetch(
+            "SELECT name, count FROM habits "
+            "WHERE user_id = $1 ORDER BY count DESC LIMIT 3",
+            user_id
+        )
+        avg_streak = await conn.fetchval(
+            "SELECT COALESCE(AVG(streak), 0) FROM habits WHERE user_id = $1",
+            user_id
+        )
+    return total, best_streak, top_habits, avg_streak
+
+
+async def legacy_week_stats(user_id: int):
+    async with database.acquire() as conn:
+        week_done = await conn.fetchrow(
+            """
+            SELECT COUNT(*) AS done
+            FROM habits
+            WHERE user_id = $1
+              AND last_done >= CURRENT_DATE - INTERVAL '7 days'
+            """,
+            user_id
+        )
+        top_week = await conn.fetch(
+            """
+            SELECT name, COUNT(*) AS cnt
+            FROM habits
+            WHERE user_id = $1
+              AND last_done >= CURRENT_DATE - INTERVAL '7 days'
+            GROUP BY name
+            ORDER BY cnt DESC
+            LIMIT 3
+            """,
+            user_id
+        )
+    return week_done["done"], top_week
+
+
+async def clear_stats_user():
+    async with database.acquire() as conn:
+        await conn.execute("DELETE FROM habit_completions WHERE user_id = $1", BENCH_USER_ID)
+        await conn.execute("DELETE FROM habits WHERE user_id = $1", BENCH_USER_ID)
+
+
+async def stats_cmd(args):
+    await clear_stats_user()
+    async with database.acquire() as conn:
+        habit_ids = [
+            await conn.fetchval(
+                """
+                INSERT INTO habits (user_id, name, count, streak, last_done)
+                VALUES ($1, $2, $3, $4, CURRENT_DATE - $5::int)
+                RETURNING id
+                """,
+                BENCH_USER_ID, f"Привычка {i}", random.randint(0, 300),
+                random.randint(0, 30), random.randint(0, 10)
+            )
+            for i in range(args.habits)
+        ]
+        await conn.executemany(
+            "INSERT INTO habit_completions (habit_id, user_id, done_on) "
+            "VALUES ($1, $2, CURRENT_DATE - $3::int)",
+            [
+                (habit_id, BENCH_USER_ID, day)
+                for habit_id in habit_ids
+                for day in range(30) if random.random() < 0.6
+            ]
+        )
+
+    variants = (
+        ("/stats: 4 запроса", legacy_stats),
+        ("/stats: 1 запрос", database.get_stats),
+        ("/week_stats: last_done", legacy_week_stats),
+        ("/week_stats: история", database.get_week_stats),
+    )
+    try:
+        # Прогрев: подготовленные выражения и кэш страниц
+        for _, func in variants:
+            for _ in range(20):
+                await func(BENCH_USER_ID)
+
+        print(f"{args.habits} привычек, {args.runs} вызовов подряд\n")
+        print(f"{'вариант':<28}{'p50, мс':>10}{'p99, мс':>10}")
+        for name, func in variants:
+            latencies = []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                await func(BENCH_USER_ID)
+                latencies.append(time.perf_counter() - started)
+            report(name, latencies)
+    finally:
+        await clear_stats_user()
+
+
+async def ticker(stop: asyncio.Event, lags: list, interval: float = 0.001):
+    # Опоздание каждого пробуждения = сколько loop был занят чужим кодом
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def log_burst(log: logging.Logger, records: int, chunk: int):
+    for i in range(records):
+        log.info("Пользователь %s отметил привычку %s", i, "Зарядка")
+        if i % chunk == chunk - 1:
+            # Между апдейтами handler отдаёт управление loop'у
+            await asyncio.sleep(0)
+
+
+async def measure_stall(name: str, handlers: list, queued: bool, args):
+    log = logging.getLogger(f"bench.{name}")
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+    listener = None
+    if queued:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        log.addHandler(LazyQueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            log.addHandler(handler)
+
+    stop = asyncio.Event()
+    lags = []
+    tick = asyncio.create_task(ticker(stop, lags))
+    await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await log_burst(log, args.records, args.chunk)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+
+    if listener is not None:
+        listener.stop()  # дожидается, пока очередь допишется
+    for handler in handlers:
+        handler.close()
+    log.handlers.clear()
+
+    print(
+        f"{name:<24}{elapsed * 1000:>12.1f}{percentile(lags, 0.5) * 1000:>10.3f}"
+        f"{percentile(lags, 0.99) * 1000:>10.3f}{max(lags) * 1000:>10.3f}"
+    )
+
+
+async def logging_cmd(args):
+    formatter = logging.Formatter(
+        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        def handlers(name: str) -> list:
+            file_handler = RotatingFileHandler(
+                Path(tmp) / f"{name}.log", maxBytes=5_000_000, backupCount=5
+            )
+            # Консоль заменяем файлом, чтобы не заливать терминал
+            console_handler = logging.StreamHandler(
+                open(Path(tmp) / f"{name}.console", "w", encoding="utf-8")
+            )
+            for handler in (file_handler, console_handler):
+                handler.setFormatter(formatter)
+            return [file_handler, console_handler]
+
+        print(f"{args.records} записей, loop отдаётся каждые {args.chunk}\n")
+        # Лаг — опоздание 1-мс таймера в loop'е, мс; поток listener'а
+        # тоже держит GIL, поэтому хвост лагов выигрывает меньше среднего
+        print(
+            f"{'вариант':<24}{'всплеск, мс':>12}{'p50 лаг':>10}"
+            f"{'p99 лаг':>10}{'макс лаг':>10}"
+        )
+        await measure_stall("handler в loop", handlers("sync"), False, args)
+        await measure_stall("очередь + listener", handlers("queued"), True, args)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки Habit Tracker")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("stats")
+    stats.add_argument("--habits", type=int, default=20)
+    stats.add_argument("--runs", type=int, default=500)
+    stats.set_defaults(handler=stats_cmd, needs_db=True)
+
+    logs = commands.add_parser("logging")
+    logs.add_argument("--records", type=int, default=50_000)
+    logs.add_argument("--chunk", type=int, default=100,
+                      help="Записей между переключениями loop'а")
+    logs.set_defaults(handler=logging_cmd, needs_db=False)
+
+    args = parser.parse_args()
+    if args.needs_db:
+        await database.init_db()
+    await args.handler(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,42 +1,101 @@
 import asyncio
 import logging
+from datetime import datetime, timezone
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from Habit_TrackerBot.config import TOKEN
-from Habit_TrackerBot import database
-from Habit_TrackerBot.handlers import commands, habits
+from Habit_TrackerBot.config import TOKEN, BOT_MODE, METRICS_HOST, METRICS_PORT
+from Habit_TrackerBot import database, metrics
+from Habit_TrackerBot.handlers import commands, habits, transfer
 from Habit_TrackerBot.handlers.commands import set_commands
+from Habit_TrackerBot.handlers.middlewares import (
+    MetricsMiddleware, StorageFlushMiddleware, ThrottlingMiddleware
+)
 from Habit_TrackerBot.handlers.scheduler_bot import scheduler, send_reminders
 from Habit_TrackerBot.logger import setup_logging
+from Habit_TrackerBot.settings_snapshot import snapshot
+from Habit_TrackerBot.storage import PostgresStorage
+from Habit_TrackerBot.webhook import WebhookServer, check_config
 
 
 async def main():
     setup_logging()
+    if BOT_MODE == "webhook":
+        check_config()
     logging.info("Бот Habit Tracker запущен")
 
     await database.init_db()
+    metrics.instrument_database(database)
     logging.info("База данных подключена")
 
+    await snapshot.start()
+
     bot = Bot(token=TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    storage = PostgresStorage()
+    # FSM-middleware подключаем вручную после троттлинга, чтобы
+    # отброшенные апдейты не читали состояние из базы
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    dp.update.outer_middleware(ThrottlingMiddleware())
+    dp.update.outer_middleware(StorageFlushMiddleware(storage))
+    dp.update.outer_middleware(dp.fsm)
+    dp.shutdown.register(storage.close)
+    dp.shutdown.register(snapshot.close)
 
     await set_commands(bot)
     logging.info("Команды бота установлены")
 
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
     dp.include_router(commands.router)
     dp.include_router(habits.router)
+    dp.include_router(transfer.router)
 
+    # Первый запуск сразу: тик догоняет минуты, пропущенные во время простоя
     scheduler.add_job(
         send_reminders,
         trigger="cron",
         minute="*",
-        args=[bot]
+        args=[bot],
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(timezone.utc)
+    )
+    # Слоты напоминаний зависят от смещения поясов, пересчитываем их
+    # каждый час, чтобы переход на летнее время не сдвигал напоминания
+    # (пересчитывает одна реплика, остальные пропускают)
+    scheduler.add_job(
+        database.refresh_reminder_slots,
+        trigger="cron",
+        minute=0
+    )
+    # Полночь у пользователей наступает в разные часы UTC
+    scheduler.add_job(
+        database.reset_broken_streaks,
+        trigger="cron",
+        minute=5
+    )
+    scheduler.add_job(
+        database.prune_reminder_ledger,
+        trigger="cron",
+        hour=3,
+        minute=30
+    )
+    scheduler.add_job(
+        storage.sweep,
+        trigger="interval",
+        minutes=10
     )
     scheduler.start()
     logging.info("Планировщик запущен ")
 
-    await dp.start_polling(bot)
+    if METRICS_PORT:
+        await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        logging.info("Метрики доступны на %s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+    if BOT_MODE == "webhook":
+        await WebhookServer(dp, bot).run()
+    else:
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,152 +1,726 @@
+import itertools
+import time as clock
+from contextlib import asynccontextmanager
+from datetime import timezone
+
 import asyncpg
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from cache import TTLCache
+from migrate import migrate
+from config import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_COMMAND_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE, DB_MAX_INACTIVE_LIFETIME, DB_ACQUIRE_TIMEOUT,
+    DB_REPLICA_HOST, DB_REPLICA_PORT, READ_YOUR_WRITES_WINDOW,
+    HABITS_CACHE_SIZE, HABITS_CACHE_TTL, DEFAULT_TIMEZONE,
+    REMINDER_CATCHUP_MINUTES, REMINDER_CLAIM_TIMEOUT, REMINDER_LEDGER_DAYS,
+)
 
 pool: asyncpg.Pool | None = None
+read_pool: asyncpg.Pool | None = None
+
+HABITS_FETCH_CHUNK = 1000
+STREAK_ROLLOVER_BATCH = 1000  # пользователей за один UPDATE
+REMINDER_ENQUEUE_BATCH = 1000
+SLOTS_LOCK_ID = 7_240_312  # pg_advisory_xact_lock для часового пересчёта слотов
+
+# Канал NOTIFY: payload — user_id, чьи настройки изменились, или "*"
+SETTINGS_CHANNEL = "user_settings"
+# Канал NOTIFY для кэша привычек: payload — user_id или "*". Кэш и версии
+# клавиатур живут в памяти процесса, а апдейты одного пользователя могут
+# попадать на разные реплики бота
+HABITS_CHANNEL = "habits"
+
+habits_cache = TTLCache(maxsize=HABITS_CACHE_SIZE, ttl=HABITS_CACHE_TTL)
+
+# Версия списка привычек (для кэша клавиатур): меняется при add/delete.
+# Номера берутся из общего счётчика, поэтому вытесненная из кэша версия
+# не совпадёт ни с одной из выданных ранее
+_habit_versions = TTLCache(maxsize=HABITS_CACHE_SIZE, ttl=HABITS_CACHE_TTL)
+_version_counter = itertools.count(1)
+
+# Поколение списка: меняется при каждой инвалидации. Чтение, во время
+# которого поколение сменилось, не кладёт (возможно, старый) список в кэш.
+# Вытеснение записи тоже меняет значение, так что ошибка только в сторону
+# лишнего промаха
+_habit_generations = TTLCache(maxsize=HABITS_CACHE_SIZE, ttl=HABITS_CACHE_TTL)
+_generation_counter = itertools.count(1)
+_cache_epoch = 0  # растёт при полной очистке кэша
+
+# Пользователи, писавшие в базу последние READ_YOUR_WRITES_WINDOW секунд:
+# их чтения идут в основную базу, пока реплика не догонит
+_recent_writers = TTLCache(maxsize=HABITS_CACHE_SIZE, ttl=READ_YOUR_WRITES_WINDOW)
+
+
+class PoolStats:
+    def __init__(self):
+        self.acquired = 0
+        self.in_use = 0
+        self.in_use_max = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def on_acquire(self, waited: float):
+        self.acquired += 1
+        self.in_use += 1
+        self.in_use_max = max(self.in_use_max, self.in_use)
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def on_release(self):
+        self.in_use -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "size": pool.get_size() if pool else 0,
+            "max_size": pool.get_max_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "in_use": self.in_use,
+            "in_use_max": self.in_use_max,
+            "acquired": self.acquired,
+            "wait_avg": self.wait_total / self.acquired if self.acquired else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+pool_stats = PoolStats()
+
+def mark_written(user_id: int):
+    _recent_writers.set(user_id, True)
+
+def _pool_for(readonly: bool, user_id: int | None) -> asyncpg.Pool:
+    if not readonly or read_pool is None:
+        return pool
+    if user_id is not None and _recent_writers.get(user_id):
+        return pool
+    return read_pool
+
+@asynccontextmanager
+async def acquire(readonly: bool = False, user_id: int | None = None):
+    started = clock.monotonic()
+    async with _pool_for(readonly, user_id).acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+        pool_stats.on_acquire(clock.monotonic() - started)
+        try:
+            yield conn
+        finally:
+            pool_stats.on_release()
+
+async def connect():
+    # Отдельное соединение вне пула (для LISTEN)
+    return await asyncpg.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME
+    )
 
 async def init_db():
-    global pool
+    global pool, read_pool
     pool = await asyncpg.create_pool(
         host=DB_HOST,
         port=DB_PORT,
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME,
-        min_size=1,
-        max_size=5
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME
+    )
+    if DB_REPLICA_HOST:
+        read_pool = await asyncpg.create_pool(
+            host=DB_REPLICA_HOST,
+            port=DB_REPLICA_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME
+        )
+    async with acquire() as conn:
+        if not await _timezone_exists(conn, DEFAULT_TIMEZONE):
+            raise ValueError(f"Unknown DEFAULT_TIMEZONE: {DEFAULT_TIMEZONE}")
+        # Пояс по умолчанию нужен SQL-миграциям (слоты в 0005)
+        await conn.execute(
+            "SELECT set_config('habit_tracker.default_timezone', $1, false)",
+            DEFAULT_TIMEZONE
+        )
+        await migrate(conn)
+
+def _user_today(user_param: str, default_tz_param: str) -> str:
+    # Текущая дата в часовом поясе пользователя (или в поясе по умолчанию)
+    return (
+        "(now() AT TIME ZONE COALESCE("
+        f"(SELECT timezone FROM user_settings WHERE user_id = {user_param}), "
+        f"{default_tz_param}::text))::date"
     )
-    async with pool.acquire() as conn:
-        await conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS habits (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                name TEXT NOT NULL,
-                count INTEGER DEFAULT 0)
-        """)
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS user_settings (
-                user_id BIGINT PRIMARY KEY,
-                reminders_enabled BOOLEAN DEFAULT FALSE,
-                reminder_time TIME DEFAULT '20:00')
-        """)
-        await conn.execute("""
-            ALTER TABLE habits
-            ADD COLUMN IF NOT EXISTS streak INTEGER DEFAULT 0,
-            ADD COLUMN IF NOT EXISTS last_done DATE
-        """)
-        await conn.execute("""
-            ALTER TABLE user_settings
-            ADD COLUMN IF NOT EXISTS reminder_days TEXT DEFAULT 'all'
-        """)
 
 async def get_user_habits(user_id: int):
-    async with pool.acquire() as conn:
-        return await conn.fetch(
-            "SELECT id, name, count, streak, last_done FROM habits WHERE user_id = $1 ORDER BY id",
-            user_id
+    habits = habits_cache.get(user_id)
+    if habits is None:
+        # Список кэшируется на HABITS_CACHE_TTL, поэтому читаем его только
+        # из основной базы: запись с другой реплики бота не попадает в
+        # локальное окно read-your-writes, и отставание реплики базы
+        # растянулось бы до времени жизни кэша
+        generation = (_cache_epoch, _habit_generations.get(user_id))
+        async with acquire() as conn:
+            habits = await conn.fetch(
+                "SELECT id, name, count, streak, last_done FROM habits WHERE user_id = $1 ORDER BY id",
+                user_id
+            )
+        if generation == (_cache_epoch, _habit_generations.get(user_id)):
+            habits_cache.set(user_id, habits)
+    return habits
+
+async def get_user_habits_versioned(user_id: int):
+    # Версию берём до чтения: список тогда не старше версии, и кэш
+    # клавиатур не получит старый список под новой версией
+    version = habits_version(user_id)
+    return await get_user_habits(user_id), version
+
+async def get_habit(user_id: int, habit_id: int):
+    for habit in await get_user_habits(user_id):
+        if habit["id"] == habit_id:
+            return habit
+    return None
+
+def invalidate_habits(user_id: int):
+    _habit_generations.set(user_id, next(_generation_counter))
+    habits_cache.invalidate(user_id)
+
+def invalidate_all_habits():
+    global _cache_epoch
+    _cache_epoch += 1
+    habits_cache.clear()
+    _habit_versions.clear()
+
+async def notify_habits_changed(conn, user_ids=None):
+    # Остальные реплики сбросят кэш этих пользователей (None — всех).
+    # Внутри транзакции уходит при COMMIT
+    if user_ids is None:
+        await conn.execute("SELECT pg_notify($1, '*')", HABITS_CHANNEL)
+    else:
+        await conn.execute(
+            "SELECT pg_notify($1, user_id::text) FROM unnest($2::bigint[]) AS user_id",
+            HABITS_CHANNEL, list(user_ids)
         )
 
-async def get_stats(user_id: int):
-    async with pool.acquire() as conn:
-        total = await conn.fetchrow(
-            "SELECT COUNT(*) AS habits, COALESCE(SUM(count), 0) AS total_done "
-            "FROM habits WHERE user_id = $1",
-            user_id)
-
-        best_streak = await conn.fetchrow(
-            "SELECT name, streak FROM habits "
-            "WHERE user_id = $1 ORDER BY streak DESC LIMIT 1",
-            user_id
+def on_habits_notify(connection, pid, channel, payload):
+    # Свои же уведомления тоже приходят сюда — лишний промах кэша, не ошибка
+    if payload == "*":
+        invalidate_all_habits()
+    else:
+        user_id = int(payload)
+        invalidate_habits(user_id)
+        bump_habits_version(user_id)
+
+def habits_version(user_id: int) -> int:
+    version = _habit_versions.get(user_id)
+    if version is None:
+        version = next(_version_counter)
+        _habit_versions.set(user_id, version)
+    return version
+
+def bump_habits_version(user_id: int):
+    _habit_versions.invalidate(user_id)
+
+async def add_habit(user_id: int, name: str):
+    async with acquire() as conn:
+        await conn.execute(
+            "INSERT INTO habits (user_id, name) VALUES ($1, $2)",
+            user_id, name
         )
+        await notify_habits_changed(conn, [user_id])
+    mark_written(user_id)
+    invalidate_habits(user_id)
+    bump_habits_version(user_id)
 
-        top_habits = await conn.fetch(
-            "SELECT name, count FROM habits "
-            "WHERE user_id = $1 ORDER BY count DESC LIMIT 3",
-            user_id
+async def delete_habit(user_id: int, habit_id: int):
+    async with acquire() as conn:
+        habit = await conn.fetchrow(
+            "DELETE FROM habits WHERE id = $1 AND user_id = $2 RETURNING name",
+            habit_id, user_id
         )
+        await notify_habits_changed(conn, [user_id])
+    mark_written(user_id)
+    invalidate_habits(user_id)
+    bump_habits_version(user_id)
+    return habit
 
-        avg_streak = await conn.fetchval(
-            "SELECT COALESCE(AVG(streak), 0) FROM habits WHERE user_id = $1",
-            user_id
+async def complete_habits(user_id: int, habit_ids: list[int]):
+    async with acquire() as conn:
+        habits = await conn.fetch(
+            """
+            WITH today AS (
+                SELECT ({user_today}) AS day
+            ), done AS (
+                UPDATE habits h
+                SET count = h.count + 1,
+                    streak = CASE
+                        WHEN h.last_done = today.day THEN COALESCE(h.streak, 0)
+                        WHEN h.last_done = today.day - 1 THEN COALESCE(h.streak, 0) + 1
+                        ELSE 1
+                    END,
+                    last_done = today.day
+                FROM today
+                WHERE h.id = ANY($1::int[]) AND h.user_id = $2
+                RETURNING h.id, h.user_id, h.name, h.count, h.streak, today.day
+            ), logged AS (
+                INSERT INTO habit_completions (habit_id, user_id, done_on)
+                SELECT id, user_id, day FROM done
+            )
+            SELECT id, name, count, streak FROM done ORDER BY id
+            """.format(user_today=_user_today("$2", "$3")),
+            habit_ids, user_id, DEFAULT_TIMEZONE
         )
-    return total, best_streak, top_habits, avg_streak
+        if habits:
+            await notify_habits_changed(conn, [user_id])
+    mark_written(user_id)
+    invalidate_habits(user_id)
+    return habits
 
-async def get_week_stats(user_id: int):
-    async with pool.acquire() as conn:
-        week_done = await conn.fetchrow(
+async def get_pending_habits_for_users(user_ids: list[int]):
+    # Только привычки, не отмеченные сегодня по времени пользователя;
+    # у кого всё выполнено, тот в выдачу не попадает
+    async with acquire(readonly=True) as conn:
+        async with conn.transaction(readonly=True):
+            current_user, habits = None, []
+            async for record in conn.cursor(
+                """
+                SELECT h.user_id, h.id, h.name, h.count, h.streak, h.last_done
+                FROM habits h
+                LEFT JOIN user_settings s ON s.user_id = h.user_id
+                WHERE h.user_id = ANY($1::bigint[])
+                  AND h.last_done IS DISTINCT FROM
+                      (now() AT TIME ZONE COALESCE(s.timezone, $2::text))::date
+                ORDER BY h.user_id, h.id
+                """,
+                user_ids, DEFAULT_TIMEZONE,
+                prefetch=HABITS_FETCH_CHUNK
+            ):
+                if record["user_id"] != current_user:
+                    if habits:
+                        yield current_user, habits
+                    current_user, habits = record["user_id"], []
+                habits.append(record)
+            if habits:
+                yield current_user, habits
+
+async def reset_broken_streaks():
+    # Обнуляет серии, пропустившие вчерашний день по времени пользователя.
+    # Идём диапазонами user_id: каждый UPDATE — своя короткая транзакция
+    last_user_id, reset = -1, 0
+    while True:
+        async with acquire() as conn:
+            row = await conn.fetchrow(
+                """
+                WITH bound AS (
+                    SELECT max(user_id) AS upper FROM (
+                        SELECT DISTINCT user_id FROM habits
+                        WHERE user_id > $1
+                        ORDER BY user_id
+                        LIMIT $2
+                    ) b
+                ), reset AS (
+                    UPDATE habits h
+                    SET streak = 0
+                    FROM bound
+                    WHERE h.user_id > $1 AND h.user_id <= bound.upper
+                      AND h.streak > 0
+                      AND (h.last_done IS NULL OR h.last_done < ({user_today}) - 1)
+                    RETURNING h.user_id
+                )
+                SELECT (SELECT upper FROM bound) AS upper,
+                       array(SELECT DISTINCT user_id FROM reset) AS users
+                """.format(user_today=_user_today("h.user_id", "$3")),
+                last_user_id, STREAK_ROLLOVER_BATCH, DEFAULT_TIMEZONE
+            )
+            if row["users"]:
+                await notify_habits_changed(conn, row["users"])
+        if row["upper"] is None:
+            return reset
+
+        for user_id in row["users"]:
+            mark_written(user_id)
+            invalidate_habits(user_id)
+        reset += len(row["users"])
+        last_user_id = row["upper"]
+
+async def get_stats(user_id: int):
+    async with acquire(readonly=True, user_id=user_id) as conn:
+        return await conn.fetch(
             """
-            SELECT COUNT(*) AS done
+            SELECT
+                name,
+                count,
+                COUNT(*) OVER () AS habits,
+                COALESCE(SUM(count) OVER (), 0) AS total_done,
+                FIRST_VALUE(name) OVER by_streak AS best_name,
+                MAX(streak) OVER () AS best_streak,
+                COALESCE(AVG(streak) OVER (), 0) AS avg_streak
             FROM habits
             WHERE user_id = $1
-              AND last_done >= CURRENT_DATE - INTERVAL '7 days'
+            WINDOW by_streak AS (
+                ORDER BY streak DESC NULLS LAST
+                ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+            )
+            ORDER BY count DESC
+            LIMIT 3
             """,
             user_id
         )
 
-        top_week = await conn.fetch(
+async def get_completion_stats(user_id: int, days: int):
+    async with acquire(readonly=True, user_id=user_id) as conn:
+        top = await conn.fetch(
             """
-            SELECT name, COUNT(*) AS cnt
-            FROM habits
-            WHERE user_id = $1
-              AND last_done >= CURRENT_DATE - INTERVAL '7 days'
-            GROUP BY name
+            SELECT
+                h.name,
+                COUNT(*) AS cnt,
+                SUM(COUNT(*)) OVER ()::int AS done
+            FROM habit_completions c
+            JOIN habits h ON h.id = c.habit_id
+            WHERE c.user_id = $1
+              AND c.done_on > ({user_today}) - $2::int
+            GROUP BY h.id, h.name
             ORDER BY cnt DESC
             LIMIT 3
-            """,
-            user_id
+            """.format(user_today=_user_today("$1", "$3")),
+            user_id, days, DEFAULT_TIMEZONE
         )
 
-    return week_done["done"], top_week
+    done = top[0]["done"] if top else 0
+    return done, top
 
-async def set_reminder(user_id: int, enabled: bool):
-    async with pool.acquire() as conn:
-        await conn.execute(
-            """
-            INSERT INTO user_settings (user_id, reminders_enabled)
-            VALUES ($1, $2)
-            ON CONFLICT (user_id)
-            DO UPDATE SET reminders_enabled = $2
-            """,
-            user_id, enabled
+async def get_week_stats(user_id: int):
+    return await get_completion_stats(user_id, 7)
+
+# Минута недели в UTC для каждого дня напоминаний пользователя на ближайшие
+# 7 локальных дат: смещение берётся на конкретную дату, поэтому переход на
+# летнее время учитывается (слоты пересчитываются каждый час)
+REMINDER_SLOTS_SELECT = """
+    SELECT DISTINCT
+        ((EXTRACT(ISODOW FROM t.utc) - 1) * 1440
+            + EXTRACT(HOUR FROM t.utc) * 60
+            + EXTRACT(MINUTE FROM t.utc))::smallint,
+        s.user_id
+    FROM user_settings s
+    CROSS JOIN LATERAL (SELECT COALESCE(s.timezone, $2::text) AS name) tz
+    CROSS JOIN generate_series(0, 6) AS d
+    CROSS JOIN LATERAL (
+        SELECT (now() AT TIME ZONE tz.name)::date + d AS day
+    ) l
+    CROSS JOIN LATERAL (
+        SELECT ((l.day + s.reminder_time) AT TIME ZONE tz.name) AT TIME ZONE 'UTC' AS utc
+    ) t
+    WHERE s.reminders_enabled
+      AND s.reminder_time IS NOT NULL
+      AND ($1::bigint IS NULL OR s.user_id = $1)
+      AND (
+        s.reminder_days = 'all'
+        OR (EXTRACT(ISODOW FROM l.day)::int - 1) = ANY(string_to_array(s.reminder_days, ',')::int[])
+      )
+"""
+
+REMINDER_SLOTS_SQL = f"""
+    INSERT INTO reminder_slots (slot, user_id)
+    {REMINDER_SLOTS_SELECT}
+    ON CONFLICT DO NOTHING
+"""
+
+# Часовой пересчёт: лишние слоты удаляются, недостающие вставляются, и
+# NOTIFY уходит только пользователям, у которых что-то поменялось
+# (после перехода на летнее время), а не всем репликам на полную загрузку
+REMINDER_SLOTS_DIFF_SQL = f"""
+    WITH desired (slot, user_id) AS (
+        {REMINDER_SLOTS_SELECT}
+    ), removed AS (
+        DELETE FROM reminder_slots r
+        WHERE NOT EXISTS (
+            SELECT 1 FROM desired d
+            WHERE d.slot = r.slot AND d.user_id = r.user_id
         )
+        RETURNING r.user_id
+    ), added AS (
+        INSERT INTO reminder_slots (slot, user_id)
+        SELECT slot, user_id FROM desired
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    ), changed AS (
+        SELECT user_id FROM removed
+        UNION
+        SELECT user_id FROM added
+    )
+    SELECT count(pg_notify($3, user_id::text)) FROM changed
+"""
+
+def minute_of_week(moment) -> int:
+    # Тот же номер слота, что в reminder_slots
+    moment = moment.astimezone(timezone.utc)
+    return moment.weekday() * 1440 + moment.hour * 60 + moment.minute
+
+async def _refresh_user_slots(conn, user_id: int):
+    await conn.execute("DELETE FROM reminder_slots WHERE user_id = $1", user_id)
+    await conn.execute(REMINDER_SLOTS_SQL, user_id, DEFAULT_TIMEZONE)
+    # Уходит при COMMIT: реплики перечитают настройки пользователя
+    await conn.execute("SELECT pg_notify($1, $2)", SETTINGS_CHANNEL, str(user_id))
+
+async def refresh_reminder_slots():
+    # Задача стоит на каждой реплике, а пересчитывает одна: остальные
+    # видят занятый замок и пропускают этот час
+    async with acquire() as conn:
+        async with conn.transaction():
+            if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", SLOTS_LOCK_ID):
+                return None
+            return await conn.fetchval(
+                REMINDER_SLOTS_DIFF_SQL, None, DEFAULT_TIMEZONE, SETTINGS_CHANNEL
+            )
+
+async def iter_reminder_settings(user_ids: list[int] | None = None):
+    async with acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for record in conn.cursor(
+                """
+                SELECT s.user_id, s.reminders_enabled, s.reminder_time,
+                       s.reminder_days, COALESCE(s.timezone, $2::text) AS timezone,
+                       COALESCE(array_agg(r.slot) FILTER (WHERE r.slot IS NOT NULL), '{}') AS slots
+                FROM user_settings s
+                LEFT JOIN reminder_slots r ON r.user_id = s.user_id
+                WHERE $1::bigint[] IS NULL OR s.user_id = ANY($1::bigint[])
+                GROUP BY s.user_id
+                """,
+                user_ids, DEFAULT_TIMEZONE,
+                prefetch=HABITS_FETCH_CHUNK
+            ):
+                yield record
+
+async def set_reminder(user_id: int, enabled: bool):
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO user_settings (user_id, reminders_enabled)
+                VALUES ($1, $2)
+                ON CONFLICT (user_id)
+                DO UPDATE SET reminders_enabled = $2
+                """,
+                user_id, enabled
+            )
+            await _refresh_user_slots(conn, user_id)
+    mark_written(user_id)
 
 async def set_reminder_with_time(user_id: int, enabled: bool, time: str):
-    async with pool.acquire() as conn:
-        await conn.execute(
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO user_settings (user_id, reminders_enabled, reminder_time)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (user_id)
+                DO UPDATE SET
+                    reminders_enabled = $2,
+                    reminder_time = $3
+                """,
+                user_id, enabled, time
+            )
+            await _refresh_user_slots(conn, user_id)
+    mark_written(user_id)
+
+async def set_reminder_schedule(user_id: int, days: str):
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                UPDATE user_settings
+                SET reminder_days = $2
+                WHERE user_id = $1
+                """,
+                user_id, days
+            )
+            await _refresh_user_slots(conn, user_id)
+    mark_written(user_id)
+
+async def _timezone_exists(conn, name: str) -> bool:
+    # Проверяем по tzdata самого PostgreSQL: именно он потом считает
+    # AT TIME ZONE, и версия базы поясов у него может отличаться от бота
+    return await conn.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM pg_timezone_names WHERE name = $1)",
+        name
+    )
+
+async def set_timezone(user_id: int, timezone: str) -> bool:
+    async with acquire() as conn:
+        async with conn.transaction():
+            if not await _timezone_exists(conn, timezone):
+                return False
+            await conn.execute(
+                """
+                INSERT INTO user_settings (user_id, timezone)
+                VALUES ($1, $2)
+                ON CONFLICT (user_id)
+                DO UPDATE SET timezone = $2
+                """,
+                user_id, timezone
+            )
+            await _refresh_user_slots(conn, user_id)
+    mark_written(user_id)
+    return True
+
+async def disable_unreachable_users(user_ids: list[int]):
+    # Бот заблокирован или чата нет: выключаем напоминания, убираем слоты
+    # и FSM, чтобы такие пользователи больше не попадали в рассылку
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "UPDATE user_settings SET reminders_enabled = FALSE WHERE user_id = ANY($1::bigint[])",
+                user_ids
+            )
+            await conn.execute(
+                "DELETE FROM reminder_slots WHERE user_id = ANY($1::bigint[])",
+                user_ids
+            )
+            await conn.execute(
+                "DELETE FROM fsm_storage WHERE user_id = ANY($1::bigint[])",
+                user_ids
+            )
+            await conn.execute(
+                "SELECT pg_notify($1, user_id::text) FROM unnest($2::bigint[]) AS user_id",
+                SETTINGS_CHANNEL, user_ids
+            )
+            await notify_habits_changed(conn, user_ids)
+
+    for user_id in user_ids:
+        mark_written(user_id)
+        invalidate_habits(user_id)
+        bump_habits_version(user_id)
+
+async def enqueue_reminders(now, due_users):
+    # Записывает все тики после последнего обработанного (не старше окна
+    # догона) и ставит в журнал получателей их слотов. Кто должен получить
+    # напоминание, говорит due_users(slot) — снимок настроек в памяти.
+    # Тик вставляет только одна реплика, повторы гасятся ON CONFLICT
+    async with acquire() as conn:
+        async with conn.transaction():
+            ticks = await conn.fetch(
+                """
+                WITH bounds AS (
+                    SELECT date_trunc('minute', $1::timestamptz) AS now_at,
+                           max(slot_at) AS last_at
+                    FROM reminder_ticks
+                )
+                INSERT INTO reminder_ticks (slot_at)
+                SELECT generate_series(
+                    GREATEST(
+                        COALESCE(last_at + INTERVAL '1 minute', now_at),
+                        now_at - $2::int * INTERVAL '1 minute'
+                    ),
+                    now_at,
+                    INTERVAL '1 minute'
+                )
+                FROM bounds
+                ON CONFLICT DO NOTHING
+                RETURNING slot_at
+                """,
+                now, REMINDER_CATCHUP_MINUTES
+            )
+
+            enqueued = 0
+            for tick in ticks:
+                user_ids = list(due_users(minute_of_week(tick["slot_at"])))
+                for start in range(0, len(user_ids), REMINDER_ENQUEUE_BATCH):
+                    await conn.execute(
+                        """
+                        INSERT INTO reminder_deliveries (slot_at, user_id)
+                        SELECT $1, unnest($2::bigint[])
+                        ON CONFLICT DO NOTHING
+                        """,
+                        tick["slot_at"], user_ids[start:start + REMINDER_ENQUEUE_BATCH]
+                    )
+                enqueued += len(user_ids)
+            return enqueued
+
+async def claim_reminders(limit: int):
+    # SKIP LOCKED: реплики разбирают журнал, не дожидаясь друг друга.
+    # Аренда claimed_at истекает, если реплика упала посреди рассылки.
+    # Берём сразу все ожидающие строки выбранных пользователей, чтобы
+    # догнанные минуты одного пользователя ушли одним сообщением
+    async with acquire() as conn:
+        return await conn.fetch(
             """
-            INSERT INTO user_settings (user_id, reminders_enabled, reminder_time)
-            VALUES ($1, $2, $3)
-            ON CONFLICT (user_id)
-            DO UPDATE SET
-                reminders_enabled = $2,
-                reminder_time = $3
+            WITH picked AS (
+                SELECT user_id
+                FROM reminder_deliveries
+                WHERE sent_at IS NULL
+                  AND slot_at > now() - $2::int * INTERVAL '1 minute'
+                  AND (claimed_at IS NULL
+                       OR claimed_at < now() - $3::int * INTERVAL '1 second')
+                ORDER BY slot_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            ), claimable AS (
+                SELECT slot_at, user_id
+                FROM reminder_deliveries
+                WHERE user_id IN (SELECT user_id FROM picked)
+                  AND sent_at IS NULL
+                  AND slot_at > now() - $2::int * INTERVAL '1 minute'
+                  AND (claimed_at IS NULL
+                       OR claimed_at < now() - $3::int * INTERVAL '1 second')
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE reminder_deliveries d
+            SET claimed_at = now()
+            FROM claimable c
+            WHERE d.slot_at = c.slot_at AND d.user_id = c.user_id
+            RETURNING d.slot_at, d.user_id
             """,
-            user_id, enabled, time
+            limit, REMINDER_CATCHUP_MINUTES, REMINDER_CLAIM_TIMEOUT
         )
 
-async def set_reminder_schedule(user_id: int, days: str):
-    async with pool.acquire() as conn:
+async def mark_reminders_sent(deliveries):
+    async with acquire() as conn:
         await conn.execute(
             """
-            UPDATE user_settings
-            SET reminder_days = $2
-            WHERE user_id = $1
+            UPDATE reminder_deliveries d
+            SET sent_at = now()
+            FROM unnest($1::timestamptz[], $2::bigint[]) AS s(slot_at, user_id)
+            WHERE d.slot_at = s.slot_at AND d.user_id = s.user_id
             """,
-            user_id, days
+            [row["slot_at"] for row in deliveries],
+            [row["user_id"] for row in deliveries]
         )
 
-async def get_users_with_reminders():
-    async with pool.acquire() as conn:
-        return await conn.fetch(
-            """
-            SELECT user_id, reminder_time, reminder_days
-            FROM user_settings
-            WHERE reminders_enabled = TRUE
+async def renew_reminder_claims(deliveries):
+    # Продлевает аренду ещё не отправленных строк, пока реплика их рассылает
+    async with acquire() as conn:
+        await conn.execute(
             """
+            UPDATE reminder_deliveries d
+            SET claimed_at = now()
+            FROM unnest($1::timestamptz[], $2::bigint[]) AS s(slot_at, user_id)
+            WHERE d.slot_at = s.slot_at AND d.user_id = s.user_id
+              AND d.sent_at IS NULL
+            """,
+            [row["slot_at"] for row in deliveries],
+            [row["user_id"] for row in deliveries]
         )
 
-async def get_user_settings(user_id: int):
-    async with pool.acquire() as conn:
-        return await conn.fetchrow(
-            "SELECT reminders_enabled, reminder_time FROM user_settings WHERE user_id = $1",
-            user_id
-        )
\ No newline at end of file
+async def prune_reminder_ledger():
+    async with acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "DELETE FROM reminder_deliveries WHERE slot_at < now() - $1::int * INTERVAL '1 day'",
+                REMINDER_LEDGER_DAYS
+            )
+            # Последний тик оставляем: от него считается догон
+            await conn.execute(
+                """
+                DELETE FROM reminder_ticks
+                WHERE slot_at < now() - $1::int * INTERVAL '1 day'
+                  AND slot_at < (SELECT max(slot_at) FROM reminder_ticks)
+                """,
+                REMINDER_LEDGER_DAYS
+            )
@@ -20,7 +20,10 @@ async def set_commands(bot):
         BotCommand(command="done", description="Выполненн(ая/ые) привычк(а/и)"),
         BotCommand(command="stats", description="Статистика по привычкам"),
         BotCommand(command="week_stats", description="Статистика за 7 дней"),
-        BotCommand(command="reminder", description="Управление напоминаниями")
+        BotCommand(command="reminder", description="Управление напоминаниями"),
+        BotCommand(command="timezone", description="Часовой пояс, например Europe/Moscow"),
+        BotCommand(command="export", description="Выгрузить привычки (csv/json)"),
+        BotCommand(command="import", description="Загрузить привычки из файла")
     ]
     await bot.set_my_commands(commands)
 
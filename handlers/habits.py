@@ -2,12 +2,14 @@ import logging
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from .states import AddHabit, DeleteHabit, DoneHabit, ReminderFSM
 from .keyboards import habits_keyboard, confirm_delete_keyboard, reminder_keyboard
-from datetime import date, timedelta, time
+from datetime import time
 from .. import database
+from ..settings_snapshot import snapshot
+from ..config import DEFAULT_TIMEZONE
 from .. import logger
 import re
 
@@ -19,10 +21,7 @@ async def set_time(message: Message, state: FSMContext):
         await message.answer("❌ Неверный формат. Введите HH:MM")
         return
 
-    hours, minutes = map(int, message.text.split(":"))
-    reminder_time = time(hours, minutes)
-
-    await state.update_data(reminder_time=reminder_time)
+    await state.update_data(reminder_time=message.text)
 
     await message.answer(
         "📅 Теперь выбери дни напоминаний:\n\n"
@@ -47,7 +46,8 @@ async def set_days(message: Message, state: FSMContext):
         return
 
     data = await state.get_data()
-    reminder_time = data["reminder_time"]
+    hours, minutes = map(int, data["reminder_time"].split(":"))
+    reminder_time = time(hours, minutes)
     days = days_map[message.text]
 
     await database.set_reminder_with_time(
@@ -69,12 +69,15 @@ True,
 
 @router.message(Command("reminder"))
 async def reminder_cmd(message: Message):
-    settings = await database.get_user_settings(message.from_user.id)
+    settings = snapshot.get(message.from_user.id)
 
     if settings:
-        status = "включены" if settings["reminders_enabled"] else "выключены"
-        time = settings["reminder_time"]
-        text = f"⏰ Напоминания сейчас: *{status}*\nВремя: {time}"
+        status = "включены" if settings.enabled else "выключены"
+        time = settings.reminder_time
+        text = (
+            f"⏰ Напоминания сейчас: *{status}*\nВремя: {time}\n"
+            f"Часовой пояс: {settings.timezone}"
+        )
     else:
         text = "⏰ Напоминания сейчас: *выключены*"
 
@@ -84,6 +87,24 @@ async def reminder_cmd(message: Message):
         reply_markup=reminder_keyboard()
     )
 
+@router.message(Command("timezone"))
+async def timezone_cmd(message: Message, command: CommandObject):
+    name = (command.args or "").strip()
+    if not name:
+        settings = snapshot.get(message.from_user.id)
+        current = settings.timezone if settings else DEFAULT_TIMEZONE
+        await message.answer(
+            f"🌍 Часовой пояс: {current}\n"
+            "Чтобы сменить, напиши: /timezone Europe/Moscow"
+        )
+        return
+
+    if not await database.set_timezone(message.from_user.id, name):
+        await message.answer("❌ Не знаю такой пояс. Пример: Europe/Moscow, Asia/Yekaterinburg")
+        return
+
+    await message.answer(f"✅ Часовой пояс: {name}")
+
 @router.callback_query(F.data == "reminder_on")
 async def reminder_on(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(
@@ -117,11 +138,7 @@ async def add_habit_name(message: Message, state: FSMContext):
         await message.answer("Название слишком короткое. Попробуйте еще раз")
         return
 
-    async with database.pool.acquire() as conn:
-        await conn.execute(
-            "INSERT INTO habits (user_id, name) VALUES ($1, $2)",
-            message.from_user.id, habit_name
-        )
+    await database.add_habit(message.from_user.id, habit_name)
 
     await state.clear()
     await message.answer(f"Привычка «{habit_name}» добавлена ✅")
@@ -150,71 +167,74 @@ async def cancel_fsm(message: Message, state: FSMContext):
 
 @router.message(Command("done"))
 async def done_habit(message: Message, state: FSMContext):
-    async with database.pool.acquire() as conn:
-        habits = await conn.fetch(
-            "SELECT id, name FROM habits WHERE user_id = $1",
-            message.from_user.id
-        )
+    habits, version = await database.get_user_habits_versioned(message.from_user.id)
 
     if not habits:
         await message.answer("❌ У тебя нет привычек")
         return
 
     await state.set_state(DoneHabit.choose)
+    await state.set_data({"selected": [], "page": 0})
     await message.answer(
-        "✅ Выбери привычку, которую выполнил:",
-        reply_markup=habits_keyboard(habits, "done")
+        "✅ Отметь выполненные привычки и нажми «Отметить выбранные»:",
+        reply_markup=habits_keyboard(habits, "done", version=version)
     )
 
-@router.callback_query(lambda c: c.data.startswith("done:"))
-async def done_habit_callback(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(DoneHabit.choose, F.data.startswith("done:"))
+async def done_habit_toggle(callback: CallbackQuery, state: FSMContext):
     habit_id = int(callback.data.split(":")[1])
-    today = date.today()
+
+    data = await state.get_data()
+    selected = set(data.get("selected", []))
+    selected ^= {habit_id}
+    await state.update_data(selected=sorted(selected))
+
+    habits, version = await database.get_user_habits_versioned(callback.from_user.id)
+    await callback.message.edit_reply_markup(
+        reply_markup=habits_keyboard(
+            habits, "done", data.get("page", 0),
+            version=version,
+            selected=selected
+        )
+    )
+    await callback.answer()
+
+@router.callback_query(DoneHabit.choose, F.data == "done_confirm")
+async def done_habit_confirm(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    selected = data.get("selected", [])
+
+    if not selected:
+        await callback.answer("Выбери хотя бы одну привычку", show_alert=True)
+        return
 
     logger.info(
-        "User %s marked habit %s as done",
+        "User %s marked habits %s as done",
         callback.from_user.id,
-        habit_id
+        selected
     )
 
-    async with database.pool.acquire() as conn:
-        habit = await conn.fetchrow(
-            "SELECT name, count, streak, last_done FROM habits WHERE id = $1",
-            habit_id
-        )
+    habits = await database.complete_habits(callback.from_user.id, selected)
 
-        if not habit:
-            await callback.answer("Привычка не найдена", show_alert=True)
-            return
+    if not habits:
+        await callback.answer("Привычки не найдены", show_alert=True)
+        return
 
-        if habit["last_done"] == today:
-            new_streak = habit["streak"]
-        elif habit["last_done"] == today - timedelta(days=1):
-            new_streak = habit["streak"] + 1
-        else:
-            new_streak = 1
-
-        await conn.execute(
-            "UPDATE habits SET count = count + 1, streak = $1, last_done = $2 WHERE id = $3",
-            new_streak, today, habit_id
-            )
-
-        await state.clear()
-        await callback.message.edit_text(
-        f"✅ Привычка «{habit['name']}» выполнена!\n"
-            f"🔥 Серия: {new_streak} дней подряд\n"
-            f"📊 Всего выполнено: {habit['count'] + 1}",
-            parse_mode="Markdown"
+    text = "✅ Выполнено!\n\n"
+    for habit in habits:
+        text += (
+            f"«{habit['name']}»\n"
+            f"🔥 Серия: {habit['streak']} дней подряд\n"
+            f"📊 Всего выполнено: {habit['count']}\n\n"
         )
-        await callback.answer()
+
+    await state.clear()
+    await callback.message.edit_text(text)
+    await callback.answer()
 
 @router.message(Command("delete"))
 async def delete_habit(message: Message, state: FSMContext):
-    async with database.pool.acquire() as conn:
-        habits = await conn.fetch(
-            "SELECT id, name FROM habits WHERE user_id = $1",
-            message.from_user.id
-        )
+    habits, version = await database.get_user_habits_versioned(message.from_user.id)
 
     if not habits:
         await message.answer("❌ У тебя нет привычек")
@@ -223,18 +243,46 @@ async def delete_habit(message: Message, state: FSMContext):
     await state.set_state(DeleteHabit.choose)
     await message.answer(
         "🗑 Выбери привычку для удаления:",
-        reply_markup=habits_keyboard(habits, "delete")
+        reply_markup=habits_keyboard(habits, "delete", version=version)
+    )
+
+@router.callback_query(F.data.startswith("page:"))
+async def habits_page(callback: CallbackQuery, state: FSMContext):
+    _, action, page = callback.data.split(":")
+    page = int(page)
+    habits, version = await database.get_user_habits_versioned(callback.from_user.id)
+
+    selected = frozenset()
+    if action == "done":
+        # Старая клавиатура /done не должна менять данные другого диалога
+        if await state.get_state() != DoneHabit.choose.state:
+            await callback.answer("Список устарел, вызови /done заново", show_alert=True)
+            return
+        data = await state.update_data(page=page)
+        selected = frozenset(data.get("selected", []))
+
+    await callback.message.edit_reply_markup(
+        reply_markup=habits_keyboard(
+            habits, action, page,
+            version=version,
+            selected=selected
+        )
     )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("done:") | (F.data == "done_confirm"))
+async def done_stale(callback: CallbackQuery):
+    await callback.answer("Список устарел, вызови /done заново", show_alert=True)
+
+@router.callback_query(F.data == "noop")
+async def noop_callback(callback: CallbackQuery):
+    await callback.answer()
 
 @router.callback_query(lambda c: c.data.startswith("delete:"))
 async def delete_habit_ask_confirm(callback: CallbackQuery):
     habit_id = int(callback.data.split(":")[1])
 
-    async with database.pool.acquire() as conn:
-        habit = await conn.fetchrow(
-            "SELECT name FROM habits WHERE id = $1",
-            habit_id
-        )
+    habit = await database.get_habit(callback.from_user.id, habit_id)
 
     if not habit:
         await callback.answer("Привычка уже удалена", show_alert=True)
@@ -257,20 +305,11 @@ async def confirm_delete(callback: CallbackQuery, state: FSMContext):
         habit_id
     )
 
-    async with database.pool.acquire() as conn:
-        habit = await conn.fetchrow(
-            "SELECT name FROM habits WHERE id = $1",
-            habit_id
-        )
-
-        if not habit:
-            await callback.answer("Привычка уже удалена", show_alert=True)
-            return
+    habit = await database.delete_habit(callback.from_user.id, habit_id)
 
-        await conn.execute(
-            "DELETE FROM habits WHERE id = $1",
-            habit_id
-        )
+    if not habit:
+        await callback.answer("Привычка уже удалена", show_alert=True)
+        return
 
     await state.clear()
     await callback.message.edit_text(
@@ -285,32 +324,30 @@ async def cancel_delete(callback: CallbackQuery):
 
 @router.message(Command("stats"))
 async def stats(message: Message):
-    total, best_streak, top_habits, avg_streak = await database.get_stats(
-        message.from_user.id
-    )
+    top_habits = await database.get_stats(message.from_user.id)
 
-    if total["habits"] == 0:
+    if not top_habits:
         await message.answer("У вас пока нет привычек для статистики")
         return
 
+    summary = top_habits[0]
     text = (
         "📊 Статистика по привычкам\n\n"
-        f"Всего привычек: {total['habits']}\n"
-        f"Всего выполнений: {total['total_done']}\n\n"
+        f"Всего привычек: {summary['habits']}\n"
+        f"Всего выполнений: {summary['total_done']}\n\n"
     )
 
-    if best_streak and best_streak["streak"] > 0:
+    if summary["best_streak"] and summary["best_streak"] > 0:
         text += (
             "🔥 Лучшая серия:\n"
-            f"{best_streak['name']} — {best_streak['streak']} дней\n\n"
+            f"{summary['best_name']} — {summary['best_streak']} дней\n\n"
         )
 
-    if top_habits:
-        text += "🏆 Топ по выполнению:\n"
-        for i, habit in enumerate(top_habits, start=1):
-            text += f"{i}. {habit['name']} — {habit['count']}\n"
+    text += "🏆 Топ по выполнению:\n"
+    for i, habit in enumerate(top_habits, start=1):
+        text += f"{i}. {habit['name']} — {habit['count']}\n"
 
-    text += f"\n📈 Средняя серия: {avg_streak:.1f} дней"
+    text += f"\n📈 Средняя серия: {summary['avg_streak']:.1f} дней"
 
     await message.answer(text, parse_mode="Markdown")
 
@@ -1,16 +1,65 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-def habits_keyboard(habits, action: str):
+from ..cache import TTLCache
+
+PAGE_SIZE = 10  # привычек на странице; лимит Telegram — 100 кнопок
+
+# Клавиатуры привычек по (версия списка, action, страница). Версия уникальна
+# для каждого состояния списка пользователя, user_id в ключе не нужен
+_habits_keyboards = TTLCache(maxsize=10_000, ttl=600)
+
+def _build_habits_keyboard(habits, action: str, page: int, selected=frozenset()):
+    pages = max(1, (len(habits) + PAGE_SIZE - 1) // PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+
     buttons = []
-    for habit in habits:
+    for habit in habits[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]:
+        mark = "✅ " if habit["id"] in selected else ""
         buttons.append([
             InlineKeyboardButton(
-                text=f"{habit['name']}",
+                text=f"{mark}{habit['name']}",
                 callback_data=f"{action}:{habit['id']}"
             )
         ])
+
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton(
+                text="◀️", callback_data=f"page:{action}:{page - 1}"
+            ))
+        navigation.append(InlineKeyboardButton(
+            text=f"{page + 1}/{pages}", callback_data="noop"
+        ))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton(
+                text="▶️", callback_data=f"page:{action}:{page + 1}"
+            ))
+        buttons.append(navigation)
+
+    if action == "done":
+        buttons.append([
+            InlineKeyboardButton(text="💾 Отметить выбранные", callback_data="done_confirm")
+        ])
+
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def habits_keyboard(habits, action: str, page: int = 0, version: int | None = None,
+                    selected=frozenset()):
+    # Клавиатура с отмеченными привычками своя у каждого выбора, её не кэшируем
+    if version is None or selected:
+        return _build_habits_keyboard(habits, action, page, selected)
+
+    key = (version, action, page)
+    keyboard = _habits_keyboards.get(key)
+    if keyboard is None:
+        keyboard = _build_habits_keyboard(habits, action, page)
+        _habits_keyboards.set(key, keyboard)
+    return keyboard
+
+@lru_cache(maxsize=1024)
 def confirm_delete_keyboard(habit_id: int):
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -27,26 +76,28 @@ def confirm_delete_keyboard(habit_id: int):
         ]
     )
 
-def reminder_keyboard():
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Вкл", callback_data="reminder_on"),
-                InlineKeyboardButton(text="❌ Выкл", callback_data="reminder_off")
-            ]
+REMINDER_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Вкл", callback_data="reminder_on"),
+            InlineKeyboardButton(text="❌ Выкл", callback_data="reminder_off")
         ]
-    )
+    ]
+)
 
-def reminder_days_keyboard():
-    return InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📅 Каждый день", callback_data="days_all")],
-            [
-                InlineKeyboardButton(text="Пн–Пт", callback_data="days_weekdays"),
-                InlineKeyboardButton(text="Сб–Вс", callback_data="days_weekend"),
-            ],
-            [InlineKeyboardButton(text="❌ Отмена", callback_data="days_cancel")]
-        ]
-    )
+REMINDER_DAYS_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="📅 Каждый день", callback_data="days_all")],
+        [
+            InlineKeyboardButton(text="Пн–Пт", callback_data="days_weekdays"),
+            InlineKeyboardButton(text="Сб–Вс", callback_data="days_weekend"),
+        ],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="days_cancel")]
+    ]
+)
 
+def reminder_keyboard():
+    return REMINDER_KEYBOARD
 
+def reminder_days_keyboard():
+    return REMINDER_DAYS_KEYBOARD
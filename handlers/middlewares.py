@@ -0,0 +1,122 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from .. import metrics
+from ..config import THROTTLE_RATE, THROTTLE_BURST, CALLBACK_DEDUP_WINDOW
+
+
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+
+        started = time.monotonic()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(name)
+            raise
+        finally:
+            metrics.handler_latency.observe(time.monotonic() - started, name)
+
+
+class StorageFlushMiddleware(BaseMiddleware):
+    # PostgresStorage пишет FSM отложенно; дожидаемся записи после handler'а,
+    # чтобы апдейт с несохранённым состоянием завершился ошибкой
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        result = await handler(event, data)
+        await self.storage.flush()
+        return result
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    # Лимит апдейтов на пользователя (GCRA: одно число на пользователя —
+    # момент, когда его бакет снова полон) и отсев повторных нажатий кнопок.
+    # Стоит на update раньше FSM-middleware: отброшенное не доходит до базы
+
+    # Переключатели: повторное нажатие — это отмена выбора, а не дубль
+    DEDUP_EXEMPT = ("done:",)
+
+    def __init__(
+        self,
+        rate: float = THROTTLE_RATE,
+        burst: int = THROTTLE_BURST,
+        dedup_window: float = CALLBACK_DEDUP_WINDOW,
+        sweep_interval: float = 60.0
+    ):
+        self.interval = 1 / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.dedup_window = dedup_window
+        self.sweep_interval = sweep_interval
+        self._tat: dict[int, float] = {}
+        self._seen: dict[tuple[int, str], float] = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _allow(self, user_id: int, now: float) -> bool:
+        tat = max(self._tat.get(user_id, now), now)
+        if tat - now > self.tolerance:
+            return False
+        self._tat[user_id] = tat + self.interval
+        return True
+
+    def _is_duplicate(self, user_id: int, callback_data: str | None, now: float) -> bool:
+        # У игровых и inline-callback'ов data может не быть
+        if callback_data is None or callback_data.startswith(self.DEDUP_EXEMPT):
+            return False
+        key = (user_id, callback_data)
+        if self._seen.get(key, 0) > now:
+            return True
+        self._seen[key] = now + self.dedup_window
+        return False
+
+    def _sweep(self, now: float):
+        # Пересоздаём словари: после del dict не возвращает память
+        self._tat = {user_id: tat for user_id, tat in self._tat.items() if tat > now}
+        self._seen = {key: until for key, until in self._seen.items() if until > now}
+        self._next_sweep = now + self.sweep_interval
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        callback = event.callback_query
+        if callback is not None:
+            if self._is_duplicate(user.id, callback.data, now):
+                metrics.throttled.inc("duplicate")
+                await callback.answer()
+                return None
+            if not self._allow(user.id, now):
+                metrics.throttled.inc("rate")
+                await callback.answer("⏳ Слишком часто, подожди немного")
+                return None
+        elif not self._allow(user.id, now):
+            metrics.throttled.inc("rate")
+            return None
+
+        return await handler(event, data)
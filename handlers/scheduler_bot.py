@@ -1,39 +1,84 @@
+import asyncio
 import logging
+from collections import defaultdict
 
-from anyio import current_time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
-from .. import database
+from datetime import datetime, timezone
+from .. import database, metrics
+from ..config import REMINDER_CLAIM_TIMEOUT
+from ..settings_snapshot import snapshot
+from .sender import limiter, send_many
 from .. import logger
 
 logger = logging.getLogger("scheduler")
-scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
+scheduler = AsyncIOScheduler(timezone="UTC")
+
+REMINDER_BATCH = 1000
+# Пользователей между отметками sent_at: после падения реплики
+# повторно уйдёт не больше одной такой порции
+SEND_CHUNK = 100
+
+
+def claim_size() -> int:
+    # Пачка должна уходить за половину аренды даже на лимите реплики
+    # (GLOBAL_RATE / BOT_REPLICAS), иначе её перехватит другая реплика
+    return max(1, min(REMINDER_BATCH, int(limiter.rate * REMINDER_CLAIM_TIMEOUT / 2)))
+
+
+async def _renew_claims(pending: dict):
+    # Пауза Retry-After может растянуть рассылку дольше аренды — продлеваем
+    # её для строк, которые ещё не отмечены отправленными
+    while True:
+        await asyncio.sleep(REMINDER_CLAIM_TIMEOUT / 3)
+        try:
+            await database.renew_reminder_claims(
+                [row for rows in pending.values() for row in rows]
+            )
+        except Exception:
+            logger.exception("Не удалось продлить аренду напоминаний")
 
 async def send_reminders(bot):
-    logger.info("Напоминания запущены")
-    now = datetime.now()
-    weekday = now.weekday()  # 0 = Пн, 6 = Вс
+    with metrics.reminder_run_latency.time():
+        await _send_reminders(bot)
 
-    users = await database.get_users_with_reminders()
+async def _send_reminders(bot):
+    logger.info("Напоминания запущены")
+    # Журнал доставки: тик ставит получателей в очередь (вместе с
+    # пропущенными минутами), дальше реплики разбирают её пачками.
+    # Кому пора, берём из снимка настроек — без запроса к user_settings
+    await snapshot.ensure_listening()
+    await database.enqueue_reminders(datetime.now(timezone.utc), snapshot.due_users)
 
-    for user in users:
-        days = user.get("reminder_days", "all")
+    while True:
+        deliveries = await database.claim_reminders(claim_size())
+        if not deliveries:
+            break
 
-        if days != "all":
-            allowed_days = list(map(int, days.split(",")))
-            if weekday not in allowed_days:
-                continue
+        # claim_reminders отдаёт все ожидающие минуты пользователя разом,
+        # поэтому после догона он получает одно сообщение
+        pending = defaultdict(list)
+        for row in deliveries:
+            pending[row["user_id"]].append(row)
+        user_ids = sorted(pending)
 
-        habits = await database.get_user_habits(user["user_id"])
-        if not habits:
-            continue
+        renewal = asyncio.create_task(_renew_claims(pending))
+        try:
+            for start in range(0, len(user_ids), SEND_CHUNK):
+                chunk = user_ids[start:start + SEND_CHUNK]
 
-        text = "⏰ Пора выполнить привычки!\n\n"
-        for habit in habits:
-            text += f"• {habit['name']}\n"
+                messages = []
+                async for user_id, habits in database.get_pending_habits_for_users(chunk):
+                    text = "⏰ Пора выполнить привычки!\n\n"
+                    for habit in habits:
+                        text += f"• {habit['name']}\n"
+                    messages.append((user_id, text))
 
-        await bot.send_message(
-            user["user_id"],
-            text,
-            parse_mode="Markdown"
-        )
+                stats = await send_many(bot, messages)
+                await database.mark_reminders_sent(
+                    [row for user_id in chunk for row in pending.pop(user_id)]
+                )
+                if stats.unreachable:
+                    logger.info("Выключаю напоминания у %s недоступных чатов", len(stats.unreachable))
+                    await database.disable_unreachable_users(stats.unreachable)
+        finally:
+            renewal.cancel()
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+)
+
+from .. import metrics
+from ..config import BOT_REPLICAS
+
+logger = logging.getLogger("sender")
+
+GLOBAL_RATE = 30  # сообщений в секунду на бота (лимит Telegram)
+PER_CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+WORKERS = 16
+MAX_RETRIES = 3
+
+# Причины, после которых слать в чат бессмысленно
+UNREACHABLE = ("forbidden", "chat_not_found")
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, TelegramForbiddenError):
+        return "forbidden"  # бот заблокирован или аккаунт удалён
+    if isinstance(error, TelegramBadRequest) and "chat not found" in error.message.lower():
+        return "chat_not_found"
+    if isinstance(error, TelegramRetryAfter):
+        return "rate_limited"
+    return "error"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def pause(self, seconds: float):
+        # Retry-After от Telegram: уводим бакет в минус, все воркеры ждут.
+        # 429 обычно приходит всем запросам в полёте разом — паузы
+        # перекрываются (берём самую длинную), а не складываются
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+@dataclass
+class SendStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    failures: Counter = field(default_factory=Counter)
+    unreachable: list = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def latency_avg(self) -> float:
+        return self.latency_total / self.sent if self.sent else 0.0
+
+    def observe(self, latency: float):
+        self.sent += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def fail(self, chat_id: int, reason: str):
+        self.failed += 1
+        self.failures[reason] += 1
+        if reason in UNREACHABLE:
+            self.unreachable.append(chat_id)
+
+
+# Бюджет на процесс: реплики с одним токеном делят GLOBAL_RATE поровну
+limiter = TokenBucket(GLOBAL_RATE / max(BOT_REPLICAS, 1))
+
+
+async def _send_one(bot, chat_id: int, text: str, stats: SendStats,
+                    last_sent: dict, bucket: TokenBucket):
+    for attempt in range(MAX_RETRIES + 1):
+        wait = last_sent.get(chat_id, 0) + PER_CHAT_INTERVAL - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await bucket.acquire()
+
+        started = time.monotonic()
+        try:
+            await bot.send_message(chat_id, text, parse_mode="Markdown")
+        except TelegramRetryAfter as e:
+            logger.warning("Flood control for chat %s, retry in %s s", chat_id, e.retry_after)
+            bucket.pause(e.retry_after)
+            stats.retried += 1
+            continue
+        except TelegramAPIError as e:
+            reason = classify_error(e)
+            logger.warning("Failed to send reminder to %s (%s): %s", chat_id, reason, e)
+            stats.fail(chat_id, reason)
+            return
+        except Exception:
+            logger.exception("Unexpected error while sending reminder to %s", chat_id)
+            stats.fail(chat_id, "error")
+            return
+        finally:
+            last_sent[chat_id] = time.monotonic()
+
+        stats.observe(time.monotonic() - started)
+        return
+
+    logger.warning("Giving up on chat %s after %s retries", chat_id, MAX_RETRIES)
+    stats.fail(chat_id, "rate_limited")
+
+
+async def send_many(bot, messages, workers: int = WORKERS,
+                    bucket: TokenBucket | None = None) -> SendStats:
+    bucket = bucket or limiter
+    stats = SendStats()
+    last_sent = {}
+    queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await _send_one(bot, *item, stats, last_sent, bucket)
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        for chat_id, text in messages:
+            await queue.put((chat_id, text))
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    stats.finished = time.monotonic()
+    metrics.reminders_sent.inc(amount=stats.sent)
+    for reason, count in stats.failures.items():
+        metrics.reminders_failed.inc(reason, amount=count)
+    metrics.reminders_retried.inc(amount=stats.retried)
+    logger.info(
+        "Sent %s messages (%s failed, %s retried) in %.2f s: %.1f msg/s, "
+        "latency avg %.3f s, max %.3f s",
+        stats.sent, stats.failed, stats.retried, stats.elapsed,
+        stats.throughput, stats.latency_avg, stats.latency_max
+    )
+    return stats
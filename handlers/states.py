@@ -11,4 +11,7 @@ class DoneHabit(StatesGroup):
 
 class ReminderFSM(StatesGroup):
     waiting_for_time = State()
-    waiting_for_days = State()
\ No newline at end of file
+    waiting_for_days = State()
+
+class ImportHabits(StatesGroup):
+    waiting_for_file = State()
@@ -0,0 +1,77 @@
+import logging
+import os
+import tempfile
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, FSInputFile
+from .states import ImportHabits
+from .. import transfer
+
+logger = logging.getLogger("transfer")
+router = Router()
+
+IMPORT_MAX_BYTES = 20 * 1024 * 1024  # больше бот скачать не может
+
+def _temp_path(fmt: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    return path
+
+@router.message(Command("export"))
+async def export_cmd(message: Message, command: CommandObject):
+    fmt = (command.args or "csv").strip().lower()
+    if fmt not in transfer.FORMATS:
+        await message.answer("❌ Формат: /export csv или /export json")
+        return
+
+    path = _temp_path(fmt)
+    try:
+        exported = await transfer.export_habits(path, fmt, message.from_user.id)
+        if not exported:
+            await message.answer("У вас пока нет привычек")
+            return
+
+        await message.answer_document(
+            FSInputFile(path, filename=f"habits.{fmt}"),
+            caption=f"📦 Экспортировано привычек: {exported}"
+        )
+    finally:
+        os.remove(path)
+
+@router.message(Command("import"))
+async def import_cmd(message: Message, state: FSMContext):
+    await state.set_state(ImportHabits.waiting_for_file)
+    await message.answer(
+        "📥 Пришли файл CSV или JSON Lines с колонками "
+        "name, count, streak, last_done (YYYY-MM-DD)"
+    )
+
+@router.message(ImportHabits.waiting_for_file, F.document)
+async def import_file(message: Message, state: FSMContext):
+    document = message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.answer("❌ Файл слишком большой (максимум 20 МБ)")
+        return
+
+    name = (document.file_name or "").lower()
+    fmt = "json" if name.endswith((".json", ".jsonl")) else "csv"
+
+    path = _temp_path(fmt)
+    try:
+        await message.bot.download(document, destination=path)
+        imported = await transfer.import_habits(path, fmt, message.from_user.id)
+    except transfer.ImportValidationError as e:
+        await message.answer(f"❌ Импорт отменён, ничего не сохранено.\n{e}")
+        return
+    finally:
+        os.remove(path)
+
+    logger.info("User %s imported %s habits", message.from_user.id, imported)
+    await state.clear()
+    await message.answer(f"✅ Импортировано привычек: {imported}")
+
+@router.message(ImportHabits.waiting_for_file)
+async def import_fallback(message: Message):
+    await message.answer("📎 Пришли файл или /cancel")
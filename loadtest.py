@@ -0,0 +1,196 @@
+"""
+Нагрузочный прогон: синтетические апдейты Telegram через настоящий Dispatcher
+с роутерами commands и habits, заглушкой вместо Bot API и локальным PostgreSQL.
+
+    python -m Habit_TrackerBot.loadtest --users 200 --rounds 5
+
+Не запускать на боевой базе: тестовые пользователи создаются с id от
+LOAD_USER_BASE и удаляются в конце прогона.
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message, Update
+
+from Habit_TrackerBot import database
+from Habit_TrackerBot.handlers import commands, habits
+from Habit_TrackerBot.handlers.middlewares import StorageFlushMiddleware
+from Habit_TrackerBot.storage import PostgresStorage
+
+LOAD_USER_BASE = 9_000_000_000_000
+
+
+class FakeSession(BaseSession):
+    # Отвечает на запросы к Bot API без сети, с настраиваемой задержкой
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=1,
+                date=datetime.now(),
+                chat=Chat(id=method.chat_id or 0, type="private"),
+                text=method.text
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class Generator:
+    # Апдейты собираются через model_validate с контекстом bot: иначе
+    # feed_update перемонтирует каждый апдейт через JSON и исказит замеры
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.update_id = 0
+
+    def _update(self, **payload) -> Update:
+        self.update_id += 1
+        return Update.model_validate(
+            {"update_id": self.update_id, **payload},
+            context={"bot": self.bot}
+        )
+
+    def _message(self, user_id: int, text: str) -> dict:
+        return {
+            "message_id": self.update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+        }
+
+    def message(self, user_id: int, text: str) -> Update:
+        return self._update(message=self._message(user_id, text))
+
+    def callback(self, user_id: int, data: str) -> Update:
+        return self._update(callback_query={
+            "id": str(self.update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "chat_instance": "load",
+            "data": data,
+            "message": self._message(user_id, "load"),
+        })
+
+
+class Report:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+
+    def observe(self, command: str, latency: float):
+        self.latencies[command].append(latency)
+
+    @staticmethod
+    def percentile(values, p: float) -> float:
+        values = sorted(values)
+        return values[int(p * (len(values) - 1))]
+
+    def print(self, elapsed: float, session: FakeSession):
+        total = sum(len(v) for v in self.latencies.values())
+        print(f"Апдейтов: {total} за {elapsed:.2f} с — {total / elapsed:.1f} upd/s")
+        print(f"Запросов к Bot API: {session.requests}\n")
+        print(f"{'команда':<12}{'кол-во':>8}{'p50, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+        for command, values in sorted(self.latencies.items()):
+            print(
+                f"{command:<12}{len(values):>8}"
+                f"{self.percentile(values, 0.5) * 1000:>10.2f}"
+                f"{self.percentile(values, 0.99) * 1000:>10.2f}"
+                f"{max(values) * 1000:>10.2f}"
+            )
+
+        pool = database.pool_stats.snapshot()
+        print(
+            f"\nПул: {pool['size']}/{pool['max_size']} соединений, "
+            f"максимум занято одновременно {pool['in_use_max']}, "
+            f"выдано {pool['acquired']}, ожидание avg {pool['wait_avg'] * 1000:.2f} мс, "
+            f"max {pool['wait_max'] * 1000:.2f} мс"
+        )
+
+
+async def run_user(dp, bot, gen: Generator, report: Report, user_id: int, rounds: int):
+    async def feed(command: str, update: Update):
+        started = time.monotonic()
+        await dp.feed_update(bot, update)
+        report.observe(command, time.monotonic() - started)
+
+    for i in range(rounds):
+        await feed("/add", gen.message(user_id, "/add"))
+        await feed("/add:name", gen.message(user_id, f"Привычка {i}"))
+        await feed("/list", gen.message(user_id, "/list"))
+
+        await feed("/done", gen.message(user_id, "/done"))
+        user_habits = await database.get_user_habits(user_id)
+        await feed("done:", gen.callback(user_id, f"done:{user_habits[-1]['id']}"))
+        await feed("done_confirm", gen.callback(user_id, "done_confirm"))
+
+        await feed("/stats", gen.message(user_id, "/stats"))
+        await feed("/week_stats", gen.message(user_id, "/week_stats"))
+
+
+async def cleanup(user_count: int):
+    async with database.acquire() as conn:
+        await conn.execute(
+            "DELETE FROM habits WHERE user_id BETWEEN $1 AND $2",
+            LOAD_USER_BASE, LOAD_USER_BASE + user_count
+        )
+        await conn.execute(
+            "DELETE FROM fsm_storage WHERE user_id BETWEEN $1 AND $2",
+            LOAD_USER_BASE, LOAD_USER_BASE + user_count
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон Habit Tracker")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="Задержка ответа заглушки Bot API, с")
+    parser.add_argument("--fsm", choices=("memory", "postgres"), default="postgres")
+    args = parser.parse_args()
+
+    await database.init_db()
+    await cleanup(args.users)
+
+    session = FakeSession(args.api_latency)
+    bot = Bot(token="123456:loadtest", session=session)
+    storage = PostgresStorage() if args.fsm == "postgres" else MemoryStorage()
+    dp = Dispatcher(storage=storage)
+    if args.fsm == "postgres":
+        dp.update.outer_middleware(StorageFlushMiddleware(storage))
+    dp.include_router(commands.router)
+    dp.include_router(habits.router)
+
+    gen = Generator(bot)
+    report = Report()
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(
+            run_user(dp, bot, gen, report, LOAD_USER_BASE + i, args.rounds)
+            for i in range(args.users)
+        ))
+        elapsed = time.monotonic() - started
+        report.print(elapsed, session)
+    finally:
+        await storage.close()
+        await cleanup(args.users)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
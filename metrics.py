@@ -0,0 +1,219 @@
+import functools
+import inspect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    ) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.values = defaultdict(float)
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] += amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+
+class CallbackGauge:
+    # Значение читается в момент запроса /metrics
+    def __init__(self, name: str, doc: str, callback, kind: str = "gauge"):
+        self.name = name
+        self.doc = doc
+        self.callback = callback
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def samples(self):
+        yield self.name, "", self.callback()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, *label_values)
+
+    def samples(self):
+        for label_values, (counts, total, count) in self.values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _labels(self.labels + ("le",), label_values + (bound,))
+                yield f"{self.name}_bucket", labels, bucket_count
+            labels = _labels(self.labels + ("le",), label_values + ("+Inf",))
+            yield f"{self.name}_bucket", labels, count
+            yield f"{self.name}_sum", _labels(self.labels, label_values), total
+            yield f"{self.name}_count", _labels(self.labels, label_values), count
+
+
+handler_latency = Histogram(
+    "bot_handler_latency_seconds", "Время работы handler'а", ("handler",)
+)
+handler_errors = Counter(
+    "bot_handler_errors_total", "Исключения в handler'ах", ("handler",)
+)
+db_query_latency = Histogram(
+    "bot_db_query_seconds", "Время выполнения функций database.py", ("query",)
+)
+db_query_errors = Counter(
+    "bot_db_query_errors_total", "Ошибки функций database.py", ("query",)
+)
+throttled = Counter(
+    "bot_throttled_total", "Отброшенные апдейты", ("reason",)
+)
+reminders_sent = Counter("bot_reminders_sent_total", "Отправлено напоминаний")
+reminders_failed = Counter(
+    "bot_reminders_failed_total", "Не доставлено напоминаний", ("reason",)
+)
+reminders_retried = Counter("bot_reminders_retried_total", "Повторы после Retry-After")
+reminder_run_latency = Histogram(
+    "bot_reminder_run_seconds", "Длительность запуска send_reminders",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0)
+)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.doc}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _timed(func):
+    name = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            except Exception:
+                db_query_errors.inc(name)
+                raise
+            finally:
+                db_query_latency.observe(time.monotonic() - started, name)
+        return wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.monotonic()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            db_query_errors.inc(name)
+            raise
+        finally:
+            db_query_latency.observe(time.monotonic() - started, name)
+    return wrapper
+
+
+def instrument_database(database):
+    # Оборачиваем корутины модуля на месте: вызовы database.get_stats(...)
+    # из handler'ов и внутренние вызовы внутри модуля идут через обёртку
+    if getattr(database, "_instrumented", False):
+        return
+    database._instrumented = True
+
+    for name, func in list(vars(database).items()):
+        if name.startswith("_") or name in ("init_db", "acquire"):
+            continue
+        if inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func):
+            if func.__module__ == database.__name__:
+                setattr(database, name, _timed(func))
+
+    stats = database.pool_stats
+    CallbackGauge("bot_db_pool_size", "Соединений в пуле",
+                  lambda: stats.snapshot()["size"])
+    CallbackGauge("bot_db_pool_idle", "Свободных соединений в пуле",
+                  lambda: stats.snapshot()["idle"])
+    CallbackGauge("bot_db_pool_in_use", "Занятых соединений",
+                  lambda: stats.in_use)
+    CallbackGauge("bot_db_pool_acquired_total", "Выдано соединений из пула",
+                  lambda: stats.acquired, kind="counter")
+    CallbackGauge("bot_db_pool_wait_seconds_total", "Суммарное ожидание соединения",
+                  lambda: stats.wait_total, kind="counter")
+
+    cache = database.habits_cache
+    CallbackGauge("bot_habits_cache_hits_total", "Попадания в кэш привычек",
+                  lambda: cache.hits, kind="counter")
+    CallbackGauge("bot_habits_cache_misses_total", "Промахи кэша привычек",
+                  lambda: cache.misses, kind="counter")
+    CallbackGauge("bot_habits_cache_size", "Пользователей в кэше привычек",
+                  lambda: len(cache))
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,95 @@
+import logging
+import re
+from pathlib import Path
+
+logger = logging.getLogger("migrate")
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+NO_TRANSACTION = "-- migrate: no-transaction"
+CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.\"]+)",
+    re.IGNORECASE
+)
+LOCK_ID = 7_240_311  # pg_advisory_lock: миграции накатывает только одна реплика
+
+
+def load_migrations():
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version = int(path.name.split("_", 1)[0])
+        migrations.append((version, path.stem, path.read_text(encoding="utf-8")))
+    return migrations
+
+
+def split_statements(sql: str):
+    statements = []
+    for chunk in re.split(r";\s*$", sql, flags=re.MULTILINE):
+        code = [line for line in chunk.splitlines() if not line.strip().startswith("--")]
+        if "".join(code).strip():
+            statements.append(chunk.strip())
+    return statements
+
+
+async def current_version(conn) -> int:
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return 0
+    return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+
+async def drop_invalid_index(conn, statement: str):
+    # Упавший CREATE INDEX CONCURRENTLY оставляет INVALID-индекс, и при
+    # повторе IF NOT EXISTS его пропустит — удаляем, чтобы построить заново
+    match = CONCURRENT_INDEX.search(statement)
+    if match is None:
+        return
+    index = match.group(1)
+    invalid = await conn.fetchval(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)",
+        index
+    )
+    if invalid:
+        logger.warning("Dropping invalid index %s left by a failed migration", index)
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+
+
+async def apply(conn, version: int, name: str, sql: str):
+    record = "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)"
+
+    if sql.startswith(NO_TRANSACTION):
+        for statement in split_statements(sql):
+            await drop_invalid_index(conn, statement)
+            await conn.execute(statement)
+        await conn.execute(record, version, name)
+        return
+
+    async with conn.transaction():
+        for statement in split_statements(sql):
+            await conn.execute(statement)
+        await conn.execute(record, version, name)
+
+
+async def migrate(conn):
+    migrations = load_migrations()
+    latest = migrations[-1][0] if migrations else 0
+
+    # Обычный старт: одна проверка версии, без DDL и блокировок
+    if await current_version(conn) >= latest:
+        return
+
+    await conn.execute("SELECT pg_advisory_lock($1)", LOCK_ID)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now())
+        """)
+        version = await current_version(conn)
+
+        for number, name, sql in migrations:
+            if number <= version:
+                continue
+            logger.info("Applying migration %s", name)
+            await apply(conn, number, name, sql)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", LOCK_ID)
@@ -0,0 +1,19 @@
+-- Исходная схема. Написана идемпотентно, чтобы базы, созданные до
+-- появления миграций, спокойно получили версию 1.
+CREATE TABLE IF NOT EXISTS habits (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER DEFAULT 0);
+
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id BIGINT PRIMARY KEY,
+    reminders_enabled BOOLEAN DEFAULT FALSE,
+    reminder_time TIME DEFAULT '20:00');
+
+ALTER TABLE habits
+ADD COLUMN IF NOT EXISTS streak INTEGER DEFAULT 0,
+ADD COLUMN IF NOT EXISTS last_done DATE;
+
+ALTER TABLE user_settings
+ADD COLUMN IF NOT EXISTS reminder_days TEXT DEFAULT 'all';
@@ -0,0 +1,23 @@
+CREATE TABLE IF NOT EXISTS habit_completions (
+    habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+    user_id BIGINT NOT NULL,
+    done_on DATE NOT NULL);
+
+CREATE INDEX IF NOT EXISTS habit_completions_user_done_idx
+ON habit_completions (user_id, done_on);
+
+CREATE INDEX IF NOT EXISTS habit_completions_habit_idx
+ON habit_completions (habit_id);
+
+-- Даты отдельных выполнений раньше не хранились: восстанавливаем
+-- только текущую серию, заканчивающуюся в last_done
+INSERT INTO habit_completions (habit_id, user_id, done_on)
+SELECT h.id, h.user_id, d::date
+FROM habits h
+CROSS JOIN LATERAL generate_series(
+    h.last_done - (GREATEST(COALESCE(h.streak, 0), 1) - 1),
+    h.last_done,
+    INTERVAL '1 day'
+) AS d
+WHERE h.last_done IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM habit_completions);
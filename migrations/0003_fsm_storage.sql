@@ -0,0 +1,9 @@
+CREATE UNLOGGED TABLE IF NOT EXISTS fsm_storage (
+    key TEXT PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    state TEXT,
+    data JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now());
+
+CREATE INDEX IF NOT EXISTS fsm_storage_updated_idx
+ON fsm_storage (updated_at);
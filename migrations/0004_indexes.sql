@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- CONCURRENTLY не блокирует запись в habits во время rolling-рестарта,
+-- но не может выполняться внутри транзакции
+CREATE INDEX CONCURRENTLY IF NOT EXISTS habits_user_id_idx
+ON habits (user_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_settings_reminders_idx
+ON user_settings (reminders_enabled, reminder_time);
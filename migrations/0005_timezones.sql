@@ -0,0 +1,39 @@
+-- NULL — пояс по умолчанию (config.DEFAULT_TIMEZONE), как и отсутствие
+-- строки настроек; сам пояс по умолчанию в схеме не хранится
+ALTER TABLE user_settings
+ADD COLUMN IF NOT EXISTS timezone TEXT;
+
+-- Моменты напоминаний в UTC как минута недели (0 = Пн 00:00 UTC).
+-- Тик планировщика ищет получателей одним равенством по slot
+CREATE TABLE IF NOT EXISTS reminder_slots (
+    slot SMALLINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    PRIMARY KEY (slot, user_id));
+
+CREATE INDEX IF NOT EXISTS reminder_slots_user_idx
+ON reminder_slots (user_id);
+
+INSERT INTO reminder_slots (slot, user_id)
+SELECT DISTINCT
+    ((EXTRACT(ISODOW FROM t.utc) - 1) * 1440
+        + EXTRACT(HOUR FROM t.utc) * 60
+        + EXTRACT(MINUTE FROM t.utc))::smallint,
+    s.user_id
+FROM user_settings s
+CROSS JOIN LATERAL (
+    SELECT COALESCE(s.timezone, current_setting('habit_tracker.default_timezone')) AS name
+) tz
+CROSS JOIN generate_series(0, 6) AS d
+CROSS JOIN LATERAL (
+    SELECT (now() AT TIME ZONE tz.name)::date + d AS day
+) l
+CROSS JOIN LATERAL (
+    SELECT ((l.day + s.reminder_time) AT TIME ZONE tz.name) AT TIME ZONE 'UTC' AS utc
+) t
+WHERE s.reminders_enabled
+  AND s.reminder_time IS NOT NULL
+  AND (
+    s.reminder_days = 'all'
+    OR (EXTRACT(ISODOW FROM l.day)::int - 1) = ANY(string_to_array(s.reminder_days, ',')::int[])
+  )
+ON CONFLICT DO NOTHING;
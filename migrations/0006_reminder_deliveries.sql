@@ -0,0 +1,17 @@
+-- Обработанные тики планировщика (минуты UTC). Следующий тик добирает
+-- все минуты после последней записанной, поэтому рестарт или долгая
+-- рассылка не теряют напоминания
+CREATE TABLE IF NOT EXISTS reminder_ticks (
+    slot_at TIMESTAMPTZ PRIMARY KEY);
+
+-- Журнал доставки: строка на (минута, пользователь). claimed_at — аренда
+-- воркера, sent_at — отправлено (или окончательно не доставлено)
+CREATE TABLE IF NOT EXISTS reminder_deliveries (
+    slot_at TIMESTAMPTZ NOT NULL,
+    user_id BIGINT NOT NULL,
+    claimed_at TIMESTAMPTZ,
+    sent_at TIMESTAMPTZ,
+    PRIMARY KEY (slot_at, user_id));
+
+CREATE INDEX IF NOT EXISTS reminder_deliveries_pending_idx
+ON reminder_deliveries (slot_at) WHERE sent_at IS NULL;
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Для удаления FSM недоступных пользователей по user_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS fsm_storage_user_id_idx
+ON fsm_storage (user_id);
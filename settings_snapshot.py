@@ -0,0 +1,132 @@
+import asyncio
+import logging
+
+from Habit_TrackerBot import database
+
+logger = logging.getLogger("settings")
+
+RETRY_DELAY = 5  # секунд до повторной загрузки после ошибки
+
+
+class UserSettings:
+    __slots__ = ("enabled", "reminder_time", "days", "timezone", "slots")
+
+    def __init__(self, record):
+        self.enabled = record["reminders_enabled"]
+        self.reminder_time = record["reminder_time"]
+        self.days = record["reminder_days"]
+        self.timezone = record["timezone"]
+        self.slots = tuple(record["slots"])
+
+
+class SettingsSnapshot:
+    # Настройки напоминаний всех пользователей в памяти процесса и индекс
+    # слот -> user_id. Загружаются один раз, дальше обновляются по NOTIFY
+    # из database.py, поэтому реплики видят одно и то же без опроса базы.
+    # Уведомления только помечают пользователей, а перечитывает их один
+    # воркер под общим замком с полной загрузкой: id, пришедшие во время
+    # загрузки, перечитываются после подмены снимка, и более старое
+    # чтение не может лечь поверх нового. Тем же LISTEN-соединением
+    # процесс получает сбросы кэша привычек от других реплик
+    def __init__(self):
+        self.users: dict[int, UserSettings] = {}
+        self.by_slot: dict[int, set[int]] = {}
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._dirty: set[int] = set()
+        self._full_reload = False
+        self._wakeup = asyncio.Event()
+        self._worker = None
+
+    def get(self, user_id: int) -> UserSettings | None:
+        return self.users.get(user_id)
+
+    def due_users(self, slot: int) -> set[int]:
+        return self.by_slot.get(slot, set())
+
+    def _put(self, users: dict, by_slot: dict, user_id: int, settings: UserSettings | None):
+        old = users.pop(user_id, None)
+        if old is not None:
+            for slot in old.slots:
+                members = by_slot.get(slot)
+                if members is not None:
+                    members.discard(user_id)
+                    if not members:
+                        del by_slot[slot]
+        if settings is not None:
+            users[user_id] = settings
+            for slot in settings.slots:
+                by_slot.setdefault(slot, set()).add(user_id)
+
+    async def load(self):
+        async with self._lock:
+            # Всё, о чём уведомили до начала чтения, попадёт в новый снимок
+            self._dirty.clear()
+            users, by_slot = {}, {}
+            async for record in database.iter_reminder_settings():
+                self._put(users, by_slot, record["user_id"], UserSettings(record))
+            self.users, self.by_slot = users, by_slot
+        logger.info("Снимок настроек загружен: %s пользователей", len(users))
+
+    async def _reload_dirty(self):
+        async with self._lock:
+            user_ids, self._dirty = self._dirty, set()
+            found = {}
+            async for record in database.iter_reminder_settings(list(user_ids)):
+                found[record["user_id"]] = UserSettings(record)
+            for user_id in user_ids:
+                self._put(self.users, self.by_slot, user_id, found.get(user_id))
+
+    def _on_notify(self, connection, pid, channel, payload):
+        if payload == "*":
+            self._full_reload = True
+        else:
+            self._dirty.add(int(payload))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                if self._full_reload:
+                    self._full_reload = False
+                    await self.load()
+                if self._dirty:
+                    await self._reload_dirty()
+            except Exception:
+                # Помеченные id могли потеряться — перечитываем всё
+                logger.exception("Не удалось обновить снимок настроек")
+                self._full_reload = True
+                await asyncio.sleep(RETRY_DELAY)
+                self._wakeup.set()
+
+    async def start(self):
+        # Сначала LISTEN, потом загрузка: изменения между ними не потеряются
+        self._conn = await database.connect()
+        await self._conn.add_listener(database.SETTINGS_CHANNEL, self._on_notify)
+        await self._conn.add_listener(database.HABITS_CHANNEL, database.on_habits_notify)
+        # Сбросы, пришедшие без соединения, потеряны — кэш начинаем заново
+        database.invalidate_all_habits()
+        await self.load()
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        if self._dirty:
+            self._wakeup.set()
+
+    async def ensure_listening(self):
+        # Пока соединение было разорвано, уведомления терялись
+        if self._conn is None or self._conn.is_closed():
+            logger.warning("LISTEN-соединение потеряно, перезагружаю снимок настроек")
+            await self.start()
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+
+snapshot = SettingsSnapshot()
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from Habit_TrackerBot import database
+from Habit_TrackerBot.config import FSM_TTL
+
+logger = logging.getLogger("storage")
+
+_UNSET = object()
+
+UPSERT_SQL = """
+    INSERT INTO fsm_storage (key, user_id, state, data, updated_at)
+    VALUES ($1, $2, $3, COALESCE($4::jsonb, '{}'::jsonb), now())
+    ON CONFLICT (key) DO UPDATE SET
+        state = CASE WHEN $5 THEN EXCLUDED.state ELSE fsm_storage.state END,
+        data = CASE WHEN $6 THEN EXCLUDED.data ELSE fsm_storage.data END,
+        updated_at = now()
+"""
+
+
+class _PendingWrite:
+    __slots__ = ("user_id", "state", "data")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.state = _UNSET
+        self.data = _UNSET
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and self.data == {}
+
+
+# FSM в UNLOGGED-таблице: записи копятся в буфере и уходят в базу одним
+# executemany, когда handler отдаёт управление (state.clear() = 1 запрос)
+class PostgresStorage(BaseStorage):
+    def __init__(self, ttl: int = FSM_TTL):
+        self.ttl = ttl
+        self._pending: dict[str, _PendingWrite] = {}
+        self._inflight: dict[str, _PendingWrite] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        thread_id = getattr(key, "thread_id", None)
+        if thread_id:
+            parts.append(f"t{thread_id}")
+        business_connection_id = getattr(key, "business_connection_id", None)
+        if business_connection_id:
+            parts.append(f"b{business_connection_id}")
+        parts.append(key.destiny)
+        return ":".join(parts)
+
+    def _buffered(self, key: str, field: str):
+        for buffer in (self._pending, self._inflight):
+            entry = buffer.get(key)
+            if entry is not None and getattr(entry, field) is not _UNSET:
+                return getattr(entry, field)
+        return _UNSET
+
+    def _write(self, key: StorageKey, **fields):
+        entry = self._pending.setdefault(self._key(key), _PendingWrite(key.user_id))
+        for field, value in fields.items():
+            setattr(entry, field, value)
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # Даём handler'у дописать state и data до первой записи в базу
+        await asyncio.sleep(0)
+
+        while self._pending:
+            self._inflight, self._pending = self._pending, {}
+            deleted = [k for k, e in self._inflight.items() if e.is_empty]
+            rows = [
+                (
+                    k,
+                    e.user_id,
+                    e.state if e.state is not _UNSET else None,
+                    json.dumps(e.data) if e.data is not _UNSET else None,
+                    e.state is not _UNSET,
+                    e.data is not _UNSET,
+                )
+                for k, e in self._inflight.items() if not e.is_empty
+            ]
+            try:
+                async with database.acquire() as conn:
+                    async with conn.transaction():
+                        if deleted:
+                            await conn.execute(
+                                "DELETE FROM fsm_storage WHERE key = ANY($1::text[])",
+                                deleted
+                            )
+                        if rows:
+                            await conn.executemany(UPSERT_SQL, rows)
+            except Exception:
+                # Возвращаем пачку в буфер (поверх неё — то, что успели записать
+                # за время flush) и отдаём ошибку тому, кто ждёт flush()
+                logger.exception("Failed to flush %s FSM records", len(self._inflight))
+                self._requeue(self._inflight)
+                raise
+            finally:
+                self._inflight = {}
+
+    def _requeue(self, batch: dict[str, _PendingWrite]):
+        for k, failed in batch.items():
+            newer = self._pending.get(k)
+            if newer is None:
+                self._pending[k] = failed
+                continue
+            for field in ("state", "data"):
+                if getattr(newer, field) is _UNSET:
+                    setattr(newer, field, getattr(failed, field))
+
+    async def flush(self):
+        # Ждём, пока записи этого апдейта дойдут до базы; ошибка записи
+        # пробрасывается в апдейт, а не теряется в фоновой задаче
+        task = self._flush_task
+        if task is None or task.done():
+            if not self._pending:
+                return
+            task = self._flush_task = asyncio.create_task(self._flush())
+        await asyncio.shield(task)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        k = self._key(key)
+        state = self._buffered(k, "state")
+        if state is not _UNSET:
+            return state
+
+        async with database.acquire() as conn:
+            return await conn.fetchval(
+                """
+                SELECT state FROM fsm_storage
+                WHERE key = $1 AND updated_at > now() - $2::int * INTERVAL '1 second'
+                """,
+                k, self.ttl
+            )
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._write(key, data=data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        k = self._key(key)
+        data = self._buffered(k, "data")
+        if data is not _UNSET:
+            return data.copy()
+
+        async with database.acquire() as conn:
+            data = await conn.fetchval(
+                """
+                SELECT data FROM fsm_storage
+                WHERE key = $1 AND updated_at > now() - $2::int * INTERVAL '1 second'
+                """,
+                k, self.ttl
+            )
+        return json.loads(data) if data else {}
+
+    async def sweep(self):
+        # Заодно повторяем записи, вернувшиеся в буфер после ошибки
+        await self.flush()
+        async with database.acquire() as conn:
+            result = await conn.execute(
+                "DELETE FROM fsm_storage WHERE updated_at < now() - $1::int * INTERVAL '1 second'",
+                self.ttl
+            )
+        logger.info("FSM sweep: %s", result)
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.error("Lost %s unflushed FSM records on shutdown", len(self._pending))
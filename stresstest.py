@@ -0,0 +1,238 @@
+"""
+Проверки под конкурентной нагрузкой на локальном PostgreSQL:
+
+    python -m Habit_TrackerBot.stresstest done --workers 200
+
+    python -m Habit_TrackerBot.stresstest sender --recipients 50000
+
+done — много корутин одновременно отмечают одну привычку; счётчик, серия и
+история выполнений должны сойтись без потерянных обновлений.
+
+sender — рассылка send_many через заглушку Bot API без сети и без базы:
+часть чатов «заблокировала» бота, часть отвечает Retry-After; все остальные
+должны получить ровно одно сообщение, а скорость — не превышать лимит.
+Затем «шторм»: Retry-After разом на все запросы в полёте — рассылка должна
+удлиниться примерно на одну паузу, а не на паузу за каждый ответ.
+
+Не запускать на боевой базе: тестовый пользователь STRESS_USER_ID создаётся
+и удаляется в ходе прогона. Код выхода 1 — проверка не прошла.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from Habit_TrackerBot import database
+from Habit_TrackerBot.handlers import sender
+from Habit_TrackerBot.loadtest import FakeSession
+
+STRESS_USER_ID = 9_200_000_000_000
+
+
+def check(failures: list, name: str, actual, expected):
+    status = "ok" if actual == expected else "FAIL"
+    print(f"  {name:<22} {actual!s:>10} (ожидается {expected}) {status}")
+    if actual != expected:
+        failures.append(name)
+
+
+async def clear():
+    async with database.acquire() as conn:
+        await conn.execute("DELETE FROM habit_completions WHERE user_id = $1", STRESS_USER_ID)
+        await conn.execute("DELETE FROM habits WHERE user_id = $1", STRESS_USER_ID)
+    database.invalidate_habits(STRESS_USER_ID)
+
+
+async def done_cmd(args) -> list:
+    # Серия 5 со вчерашним выполнением: первое отмеченное сегодня
+    # продолжает её до 6, остальные не должны её менять
+    async with database.acquire() as conn:
+        habit_id = await conn.fetchval(
+            """
+            INSERT INTO habits (user_id, name, count, streak, last_done)
+            VALUES ($1, 'Стресс', 0, 5,
+                    (now() AT TIME ZONE $2::text)::date - 1)
+            RETURNING id
+            """,
+            STRESS_USER_ID, database.DEFAULT_TIMEZONE
+        )
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(
+        database.complete_habits(STRESS_USER_ID, [habit_id])
+        for _ in range(args.workers)
+    ))
+    elapsed = time.monotonic() - started
+    print(f"{args.workers} конкурентных отметок за {elapsed:.2f} с")
+
+    async with database.acquire() as conn:
+        habit = await conn.fetchrow(
+            "SELECT count, streak FROM habits WHERE id = $1", habit_id
+        )
+        logged = await conn.fetchval(
+            "SELECT COUNT(*) FROM habit_completions WHERE habit_id = $1", habit_id
+        )
+        # Чужой пользователь не может отметить эту привычку
+        forged = await database.complete_habits(STRESS_USER_ID + 1, [habit_id])
+
+    failures = []
+    check(failures, "count", habit["count"], args.workers)
+    check(failures, "streak", habit["streak"], 6)
+    check(failures, "habit_completions", logged, args.workers)
+    check(failures, "ответов с привычкой", sum(len(r) for r in results), args.workers)
+    check(failures, "чужой user_id", len(forged), 0)
+    return failures
+
+
+class FlakySession(FakeSession):
+    # Каждый blocked_every-й чат заблокировал бота, каждый retry_every-й
+    # один раз отвечает Retry-After
+    def __init__(self, blocked_every: int, retry_every: int):
+        super().__init__()
+        self.blocked_every = blocked_every
+        self.retry_every = retry_every
+        self.delivered = Counter()
+        self.throttled = set()
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            chat_id = method.chat_id
+            if chat_id % self.blocked_every == 0:
+                raise TelegramForbiddenError(method, "Forbidden: bot was blocked by the user")
+            if chat_id % self.retry_every == 0 and chat_id not in self.throttled:
+                self.throttled.add(chat_id)
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after=0)
+            self.delivered[chat_id] += 1
+        return await super().make_request(bot, method, timeout)
+
+
+class StormSession(FakeSession):
+    # После storm_after доставок все ответы, пришедшие в одно окно длиной
+    # latency (то есть на запросы, бывшие в полёте), — Retry-After
+    def __init__(self, latency: float, storm_after: int, retry_after: int):
+        super().__init__(latency)
+        self.storm_after = storm_after
+        self.retry_after = retry_after
+        self.storm_started = None
+        self.throttled = 0
+        self.delivered = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        result = await super().make_request(bot, method, timeout)
+        if isinstance(method, SendMessage):
+            now = time.monotonic()
+            if self.storm_started is None and self.delivered.total() >= self.storm_after:
+                self.storm_started = now
+            if self.storm_started is not None and now - self.storm_started < self.latency:
+                self.throttled += 1
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after=self.retry_after)
+            self.delivered[method.chat_id] += 1
+        return result
+
+
+async def storm_case(args, failures: list):
+    recipients = args.storm_recipients
+
+    async def run(storm_after: int):
+        session = StormSession(args.storm_latency, storm_after, args.storm_retry_after)
+        bot = Bot(token="123456:stresstest", session=session)
+        messages = ((chat_id, "⏰ Пора выполнить привычки!") for chat_id in range(1, recipients + 1))
+        stats = await sender.send_many(
+            bot, messages, workers=args.workers, bucket=sender.TokenBucket(args.rate)
+        )
+        return session, stats
+
+    _, calm = await run(storm_after=recipients + 1)
+    session, storm = await run(storm_after=recipients // 2)
+    extra = storm.elapsed - calm.elapsed
+    print(
+        f"Шторм: {session.throttled} ответов Retry-After {args.storm_retry_after} с разом, "
+        f"рассылка дольше на {extra:.2f} с ({calm.elapsed:.2f} → {storm.elapsed:.2f})"
+    )
+    check(failures, "шторм: отправлено", storm.sent, recipients)
+    check(failures, "шторм: дублей", sum(1 for n in session.delivered.values() if n > 1), 0)
+    check(failures, "шторм: одновременных", session.throttled > 1, True)
+    check(failures, "шторм: одна пауза",
+          0.9 * args.storm_retry_after <= extra < 1.5 * args.storm_retry_after, True)
+
+
+async def sender_cmd(args) -> list:
+    # Тысячи предупреждений о заблокированных чатах здесь ожидаемы
+    logging.getLogger("sender").setLevel(logging.ERROR)
+    session = FlakySession(args.blocked_every, args.retry_every)
+    bot = Bot(token="123456:stresstest", session=session)
+    bucket = sender.TokenBucket(args.rate)
+
+    recipients = range(1, args.recipients + 1)
+    messages = ((chat_id, "⏰ Пора выполнить привычки!") for chat_id in recipients)
+    stats = await sender.send_many(bot, messages, workers=args.workers, bucket=bucket)
+
+    blocked = {c for c in recipients if c % args.blocked_every == 0}
+    retried = {c for c in recipients if c % args.retry_every == 0 and c not in blocked}
+    # Бакет стартует полным: первые rate сообщений уходят без ожидания
+    attempts = args.recipients + len(retried)
+    min_elapsed = max(attempts - args.rate, 0) / args.rate
+
+    print(
+        f"{args.recipients} получателей за {stats.elapsed:.2f} с: "
+        f"{stats.throughput:.0f} msg/s при лимите {args.rate:.0f}"
+    )
+    failures = []
+    check(failures, "отправлено", stats.sent, args.recipients - len(blocked))
+    check(failures, "дублей", sum(1 for n in session.delivered.values() if n > 1), 0)
+    check(failures, "forbidden", stats.failures["forbidden"], len(blocked))
+    check(failures, "недоступные чаты", set(stats.unreachable) == blocked, True)
+    check(failures, "повторы Retry-After", stats.retried, len(retried))
+    check(failures, "лимит скорости", stats.elapsed >= min_elapsed * 0.95, True)
+    if args.storm_retry_after:
+        await storm_case(args, failures)
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Конкурентные проверки Habit Tracker")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    done = commands.add_parser("done")
+    done.add_argument("--workers", type=int, default=200)
+    done.set_defaults(handler=done_cmd, needs_db=True)
+
+    send = commands.add_parser("sender")
+    send.add_argument("--recipients", type=int, default=50_000)
+    send.add_argument("--rate", type=float, default=5_000,
+                      help="Лимит бакета, msg/s (в бою — GLOBAL_RATE)")
+    send.add_argument("--workers", type=int, default=sender.WORKERS)
+    send.add_argument("--blocked-every", type=int, default=97)
+    send.add_argument("--retry-every", type=int, default=997)
+    send.add_argument("--storm-retry-after", type=int, default=2,
+                      help="Retry-After шторма, с (0 — без шторма)")
+    send.add_argument("--storm-recipients", type=int, default=2_000)
+    send.add_argument("--storm-latency", type=float, default=0.02,
+                      help="Задержка ответа заглушки в шторме, с")
+    send.set_defaults(handler=sender_cmd, needs_db=False)
+
+    args = parser.parse_args()
+    if not args.needs_db:
+        failures = await args.handler(args)
+    else:
+        await database.init_db()
+        await clear()
+        try:
+            failures = await args.handler(args)
+        finally:
+            await clear()
+
+    if failures:
+        print(f"Не прошло: {', '.join(failures)}")
+        sys.exit(1)
+    print("Все проверки прошли")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
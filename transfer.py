@@ -0,0 +1,154 @@
+import csv
+import json
+from datetime import date
+
+from Habit_TrackerBot import database
+
+FORMATS = ("csv", "json")
+COLUMNS = ("name", "count", "streak", "last_done")
+EXPORT_CHUNK = 1000
+INT4_MAX = 2**31 - 1  # count и streak — INTEGER
+BIGINT_MAX = 2**63 - 1
+
+
+class ImportValidationError(ValueError):
+    pass
+
+
+def _columns(with_user: bool) -> tuple:
+    return (("user_id",) + COLUMNS) if with_user else COLUMNS
+
+
+def _int_field(row: dict, field: str, line: int, default: int = 0,
+               maximum: int = INT4_MAX) -> int:
+    value = row.get(field)
+    if value in (None, ""):
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ImportValidationError(f"Строка {line}: {field} должно быть числом")
+    if number < 0:
+        raise ImportValidationError(f"Строка {line}: {field} не может быть отрицательным")
+    if number > maximum:
+        raise ImportValidationError(f"Строка {line}: {field} слишком большое")
+    return number
+
+
+def validate_row(row: dict, line: int, user_id: int | None) -> tuple:
+    name = str(row.get("name") or "").strip()
+    if len(name) < 2:
+        raise ImportValidationError(f"Строка {line}: слишком короткое название")
+
+    last_done = row.get("last_done")
+    if last_done in (None, ""):
+        last_done = None
+    else:
+        try:
+            last_done = date.fromisoformat(str(last_done))
+        except ValueError:
+            raise ImportValidationError(f"Строка {line}: дата должна быть в формате YYYY-MM-DD")
+
+    record = (
+        name,
+        _int_field(row, "count", line),
+        _int_field(row, "streak", line),
+        last_done,
+    )
+    if user_id is None:
+        owner = _int_field(row, "user_id", line, default=-1, maximum=BIGINT_MAX)
+        if owner < 0:
+            raise ImportValidationError(f"Строка {line}: не указан user_id")
+        return (owner,) + record
+    return (user_id,) + record
+
+
+def _read_csv(f, user_id: int | None):
+    reader = csv.DictReader(f, strict=True)
+    try:
+        for row in reader:
+            yield validate_row(row, reader.line_num, user_id)
+    except csv.Error as e:
+        raise ImportValidationError(f"Некорректный CSV после строки {reader.line_num}: {e}")
+
+
+def _read_json(f, user_id: int | None):
+    for line, raw in enumerate(f, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ImportValidationError(f"Строка {line}: некорректный JSON")
+        if not isinstance(row, dict):
+            raise ImportValidationError(f"Строка {line}: ожидается JSON-объект")
+        yield validate_row(row, line, user_id)
+
+
+def read_records(path: str, fmt: str, user_id: int | None):
+    # Генератор: файл читается построчно и уходит в COPY кусками,
+    # весь импорт в памяти не держится
+    with open(path, encoding="utf-8", newline="") as f:
+        try:
+            yield from (_read_csv if fmt == "csv" else _read_json)(f, user_id)
+        except UnicodeDecodeError:
+            raise ImportValidationError(
+                "Файл должен быть в кодировке UTF-8 (в Excel: «CSV UTF-8»)"
+            )
+
+
+async def import_habits(path: str, fmt: str, user_id: int | None = None) -> int:
+    owners = set()
+
+    def records():
+        for record in read_records(path, fmt, user_id):
+            owners.add(record[0])
+            yield record
+
+    async with database.acquire() as conn:
+        async with conn.transaction():
+            result = await conn.copy_records_to_table(
+                "habits",
+                records=records(),
+                columns=_columns(True)
+            )
+            # Импорт из admin.py идёт в отдельном процессе: запущенные боты
+            # сбросят кэш по NOTIFY после COMMIT
+            await database.notify_habits_changed(
+                conn, [user_id] if user_id is not None else None
+            )
+
+    for owner in owners:
+        database.mark_written(owner)
+    if user_id is not None:
+        database.invalidate_habits(user_id)
+        database.bump_habits_version(user_id)
+    else:
+        database.invalidate_all_habits()
+    return int(result.split()[-1])
+
+
+async def export_habits(path: str, fmt: str, user_id: int | None = None) -> int:
+    columns = ", ".join(_columns(user_id is None))
+    where, args = ("WHERE user_id = $1", [user_id]) if user_id is not None else ("", [])
+    query = f"SELECT {columns} FROM habits {where} ORDER BY user_id, id"
+
+    async with database.acquire(readonly=True, user_id=user_id) as conn:
+        if fmt == "csv":
+            result = await conn.copy_from_query(
+                query, *args, output=path, format="csv", header=True
+            )
+            return int(result.split()[-1])
+
+        # COPY не умеет JSON без экранирования, поэтому JSON Lines
+        # пишем через серверный курсор теми же кусками
+        exported = 0
+        async with conn.transaction(readonly=True):
+            with open(path, "w", encoding="utf-8") as f:
+                async for record in conn.cursor(query, *args, prefetch=EXPORT_CHUNK):
+                    row = dict(record)
+                    if row["last_done"] is not None:
+                        row["last_done"] = row["last_done"].isoformat()
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    exported += 1
+        return exported
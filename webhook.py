@@ -0,0 +1,124 @@
+import asyncio
+import hmac
+import logging
+import signal
+
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+from Habit_TrackerBot.config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS,
+)
+from Habit_TrackerBot.handlers.scheduler_bot import scheduler
+
+logger = logging.getLogger("webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+DRAIN_TIMEOUT = 30
+
+
+def check_config():
+    # Публичный webhook без секрета принимал бы апдейты от кого угодно
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set when WEBHOOK_URL is configured")
+
+
+class WebhookServer:
+    def __init__(self, dp, bot, queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS):
+        check_config()
+        self.dp = dp
+        self.bot = bot
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers_count = workers
+        self.workers: list[asyncio.Task] = []
+        self.accepting = False
+
+        self.app = web.Application()
+        self.app.router.add_post(WEBHOOK_PATH, self.handle)
+        self.app.on_startup.append(self.on_startup)
+        self.app.on_shutdown.append(self.on_shutdown)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), WEBHOOK_SECRET
+        ):
+            return web.Response(status=401)
+
+        if not self.accepting:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            logger.warning("Update queue is full, rejecting update %s", update.update_id)
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                self.queue.task_done()
+
+    async def on_startup(self, app: web.Application):
+        self.workers = [
+            asyncio.create_task(self.worker()) for _ in range(self.workers_count)
+        ]
+        await self.dp.emit_startup(bot=self.bot)
+        # Без WEBHOOK_URL сервер поднимается только локально (для отладки)
+        if WEBHOOK_URL:
+            await self.bot.set_webhook(
+                WEBHOOK_URL + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+            logger.info("Webhook установлен: %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+        self.accepting = True
+
+    async def on_shutdown(self, app: web.Application):
+        self.accepting = False
+        logger.info("Ожидание обработки %s апдейтов", self.queue.qsize())
+        try:
+            await asyncio.wait_for(self.queue.join(), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Не успели обработать %s апдейтов", self.queue.qsize())
+
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+        if scheduler.running:
+            scheduler.shutdown()
+        await self.dp.emit_shutdown(bot=self.bot)
+        await self.bot.session.close()
+
+    async def run(self):
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+        await site.start()
+        logger.info("Webhook-сервер слушает %s:%s", WEBHOOK_HOST, WEBHOOK_PORT)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()